@@ -10,6 +10,7 @@ var exports = module.exports = {};
 ****************************************************************************************/
 const path = require('path');
 const fs = require('fs');
+const os = require('os');
 const csv_parse = require('csv-parse/lib/sync');
 const replaceExt = require('replace-ext');
 
@@ -37,8 +38,11 @@ exports.ScanFileManager = function (rootScanFileDirectory) {
     this.getScanFiles = function () {
         // retrieve scan files
         let fileNames = fs.readdirSync(this.rootDir);
-        // only use CSV files
-        fileNames.filter(function (file) { return file.substr(-4) === '.csv'; });
+        // only use scan files (CSV, or binary PLY files exported directly by the scanner)
+        fileNames = fileNames.filter(function (file) {
+            let extension = path.extname(file).toLowerCase();
+            return extension === '.csv' || extension === '.ply';
+        });
         // sort chronologically
         fileNames.sort(this._compareFileTimestampDescending);
         return fileNames;
@@ -48,6 +52,9 @@ exports.ScanFileManager = function (rootScanFileDirectory) {
     this.getFormattedFile = function (filename, format) {
         let csvPath = path.join(this.rootDir, filename);
         let filePath = null;
+        // scans exported directly as binary PLY files are served as is
+        if (path.extname(filename).toLowerCase() === '.ply')
+            return (format === 'ply_binary') ? csvPath : null;
         switch (format) {
             case 'csv':
                 filePath = csvPath;
@@ -106,6 +113,13 @@ exports.deleteFile = function (filePath) {
 /****************************************************************************************
 * Private Methods
 ****************************************************************************************/
+// return the filepath of a file generated from the specified CSV filepath. Generated files
+// are written to the temp dir, so they never overwrite (or get listed with) the scan files,
+// ie: a scan exported directly as binary PLY by the scanner
+let _getGeneratedFilePath = function (csvPath, extension) {
+    return path.join(os.tmpdir(), path.basename(replaceExt(csvPath, extension)));
+}
+
 // generate XYZ file from the specified CSV filepath
 // return the filepath if successfull, null otherwise
 let _generateXYZFile = function (csvPath) {
@@ -119,7 +133,7 @@ let _generateXYZFile = function (csvPath) {
     if (!buffer)
         return null;
 
-    let xyzPath = replaceExt(csvPath, '.xyz');
+    let xyzPath = _getGeneratedFilePath(csvPath, '.xyz');
     fs.writeFileSync(xyzPath, buffer);
     return xyzPath;
 }
@@ -137,7 +151,7 @@ let _generatePLYFile = function (csvPath, bCompressToBinary) {
     if (!buffer)
         return null;
 
-    let plyPath = replaceExt(csvPath, '.ply');
+    let plyPath = _getGeneratedFilePath(csvPath, '.ply');
     fs.writeFileSync(plyPath, buffer);
     return plyPath;
 }
@@ -36,16 +36,19 @@ function populateFilesSelect(files) {
     }
 
     /* loop through the available files programmatically create an option for each */
-    let file, nameNoExt, optionName, optionHTML;
+    let file, nameNoExt, extension, displayName, optionName, optionHTML;
     for (let i = 0; i < files.length; i++) {
         file = files[i];
-        nameNoExt = file.substring(0, file.lastIndexOf('.csv'));
+        nameNoExt = file.substring(0, file.lastIndexOf('.'));
         if (nameNoExt.length <= 0)
             continue;
+        // scans exported directly as binary PLY files are marked as such
+        extension = file.substring(file.lastIndexOf('.') + 1).toLowerCase();
+        displayName = (extension === 'ply') ? `${nameNoExt} (PLY)` : nameNoExt;
         //create a new button, and insert it into the dropdown
-        optionName = `option_File_${nameNoExt}`;
+        optionName = `option_File_${nameNoExt}_${extension}`;
         optionHTML = `  <option id="${optionName}" value="${file}"> 
-                            ${nameNoExt}
+                            ${displayName}
                         </option>`
         $("#select_FileName").append(optionHTML);
     }
@@ -24,6 +24,7 @@ function initScanForm() {
     _UTILS.initDropdownForEnum('select_ScanType', _SETTINGS.SCAN_TYPE_ENUM);
     _UTILS.initDropdownForEnum('select_MotorSpeed', _SETTINGS.MOTOR_SPEED_ENUM);
     _UTILS.initDropdownForEnum('select_SampleRate', _SETTINGS.SAMPLE_RATE_ENUM);
+    _UTILS.initDropdownForEnum('select_FileFormat', _SETTINGS.FILE_FORMAT_ENUM);
 
     // Request that a scan be initiated when button is pressed
     $("#btn_PerformScan").click(function () {
@@ -124,6 +125,10 @@ function readSpecifiedScanOptions() {
     properties = _UTILS.getEnumPropertiesForKey(_SETTINGS.SAMPLE_RATE_ENUM, selectedKey);
     options.sample_rate = properties.sample_rate;
 
+    selectedKey = $('#select_FileFormat').find(":selected").val();
+    properties = _UTILS.getEnumPropertiesForKey(_SETTINGS.FILE_FORMAT_ENUM, selectedKey);
+    options.file_format = properties.file_format;
+
     let d = new Date();
     let alt_filename = "3D Scan - " + d.toDateString() + " " + d.toLocaleTimeString().replace(/:\s*/g, "-");
     options.file_name = _UTILS.textInputHasValue("#input_FileName") ? $("#input_FileName").val() : alt_filename;
@@ -45,6 +45,16 @@ ScannerLib.Settings = function () {
         }
     };
 
+    const FILE_FORMAT_ENUM = {
+        CSV: 1,
+        PLY_BINARY: 2,
+
+        properties: {
+            1: { value: 1, name: "CSV", displayName: "CSV", bIsDefault: true, file_format: "csv" },
+            2: { value: 2, name: "PLY_BINARY", displayName: "PLY (binary)", bIsDefault: false, file_format: "ply" }
+        }
+    };
+
     const TEST_TYPE_ENUM = {
         SCANNER_LIMIT_SWITCH: 1,
         SCANNER_BASE: 2,
@@ -71,6 +81,7 @@ ScannerLib.Settings = function () {
         MOTOR_SPEED_ENUM: MOTOR_SPEED_ENUM,
         SAMPLE_RATE_ENUM: SAMPLE_RATE_ENUM,
         SCAN_TYPE_ENUM: SCAN_TYPE_ENUM,
+        FILE_FORMAT_ENUM: FILE_FORMAT_ENUM,
         TEST_TYPE_ENUM: TEST_TYPE_ENUM
     };
 }();
\ No newline at end of file
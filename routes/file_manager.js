@@ -57,9 +57,12 @@ router.route('/download_file/:format/:file(*)')
         if (_STORAGE.checkFileExists(downloadPath))
             res.download(downloadPath, function (err) {
                 // delete any generated files after sending them
-                if (format !== 'csv')
+                if (downloadPath !== path.join(SCAN_FILE_DIR, filename))
                     _STORAGE.deleteFile(downloadPath);
             });
+        else
+            // ie: a scan exported as binary PLY can't be converted to other formats
+            res.status(404).send(`${filename} is not available in ${format} format.`);
     })
 
 module.exports = app;
\ No newline at end of file
@@ -130,8 +130,11 @@ function cancelScript(msg) {
 // Start the main scanner script
 //TODO: convert over to using the settings enums from the utils file
 function performScan(params) {
-    // strip away any directory or extension, then add .csv extension explicitly
-    let filename = path.parse(params.file_name).name + '.csv';
+    // strip away any directory or extension, then add the extension of the requested format
+    // explicitly (binary PLY files are exported directly by the scanner, or .csv by default)
+    let parsedName = path.parse(params.file_name);
+    let bExportPLY = params.file_format === 'ply' || parsedName.ext.toLowerCase() === '.ply';
+    let filename = parsedName.name + (bExportPLY ? '.ply' : '.csv');
 
     let argArray = [
         PY_SCAN_SCRIPT,
@@ -0,0 +1,359 @@
+"""Benchmarks for the computationally expensive parts of a scan (runs without hardware)"""
+import argparse
+import timeit
+import csv
+import StringIO
+import numpy as np
+import sweep_helpers
+import scan_utils
+import scan_session
+import transformations as tf
+import dummy_sweeppy
+import dummy_Adafruit_MotorHAT
+import scanner_base
+import scan_exporter
+
+
+def create_dummy_scan(sample_rate=None, motor_speed=None, distance=None):
+    """Returns a dummy scan with the number of samples the device reports in a single rotation
+    :param sample_rate: the sample rate in HZ, defaults to 1000HZ
+    :param motor_speed: the motor speed in HZ, defaults to 1HZ
+    :param distance: the distance of every sample, defaults to 1000
+    """
+    if sample_rate is None:
+        sample_rate = sweep_helpers.SAMPLE_RATE_1000_HZ
+    if motor_speed is None:
+        motor_speed = sweep_helpers.MOTOR_SPEED_1_HZ
+    if distance is None:
+        distance = 1000
+
+    num_samples = sample_rate // motor_speed
+    # the device reports angles in 1/16 degree increments, converted to integer milli-degrees
+    spacing = 16 * 360.0 / num_samples
+    samples = [dummy_sweeppy.Sample(angle=int(round(62.5 * round(spacing * n))),
+                                    distance=distance + n % 97,
+                                    signal_strength=199)
+               for n in range(num_samples)]
+    return dummy_sweeppy.Scan(samples=samples)
+
+
+def legacy_transform_scan(scan, mount_angle, base_angle_1, base_angle_2):
+    """The original per-sample implementation of scan_utils.transform_scan (used as a reference)"""
+    rot_mat_1 = scan_utils.get_scan_rotation_matrix(mount_angle, base_angle_1)
+    rot_mat_2 = scan_utils.get_scan_rotation_matrix(mount_angle, base_angle_2)
+
+    num_samples = len(scan.samples)
+
+    start_index_2 = num_samples
+    for index, sample in enumerate(scan.samples):
+        if sample.angle >= 180000:
+            start_index_2 = index
+            break
+
+    num_samples_1 = start_index_2
+    num_samples_2 = len(scan.samples) - start_index_2
+
+    coords = np.zeros((num_samples, 4))
+    coords_1 = np.zeros((num_samples_1, 4))
+    coords_2 = np.zeros((num_samples_2, 4))
+
+    for index, sample in enumerate(scan.samples):
+        cartesian_coord = scan_utils.polar_to_cartesian(
+            sample.distance, 0.001 * sample.angle)
+        homogeneous_coord = np.array(
+            [cartesian_coord[0], cartesian_coord[1], 0, 1])
+
+        if sample.angle < 180000:
+            coords_1[index] = homogeneous_coord
+        else:
+            coords_2[index - num_samples_1] = homogeneous_coord
+
+    coords_1 = np.dot(coords_1, rot_mat_1.T)
+    coords_2 = np.dot(coords_2, rot_mat_2.T)
+
+    for i in range(0, num_samples_1):
+        coords[i] = coords_1[i]
+    for i in range(num_samples_1, num_samples):
+        coords[i] = coords_2[i - num_samples_1]
+
+    return coords
+
+
+def time_call(func, repeat):
+    """Returns the best time (in ms) of a single call to func over the specified # of repeats"""
+    return 1000.0 * min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def benchmark_transform(repeat):
+    """Compares the vectorized transform_scan against the original per-sample implementation"""
+    scan = create_dummy_scan()
+
+    legacy_coords = legacy_transform_scan(scan, 90, 10, 11)
+    coords = scan_utils.transform_scan(scan, 90, 10, 11)
+
+    legacy_ms = time_call(
+        lambda: legacy_transform_scan(scan, 90, 10, 11), repeat)
+    vectorized_ms = time_call(
+        lambda: scan_utils.transform_scan(scan, 90, 10, 11), repeat)
+
+    print "transform_scan ({} samples)".format(len(scan.samples))
+    print "\tLegacy:     {:.3f} ms".format(legacy_ms)
+    print "\tVectorized: {:.3f} ms".format(vectorized_ms)
+    print "\tSpeedup:    {:.1f}x".format(legacy_ms / vectorized_ms)
+    print "\tMax abs difference: {}".format(np.max(np.abs(legacy_coords - coords)))
+    print "\tIdentical rounded output: {}".format(
+        np.array_equal(np.round(legacy_coords), np.round(coords)))
+
+
+def benchmark_rotations(repeat):
+    """Compares building rotation matrices in a single batched call against a python loop"""
+    num_matrices = 5000
+    gammas = np.linspace(-np.pi, np.pi, num_matrices)
+    beta = np.deg2rad(-90)
+
+    looped = np.array([tf.euler_matrix(0, beta, gamma, 'sxyz') for gamma in gammas])
+    batched = tf.euler_matrices(0, beta, gammas, 'sxyz')
+
+    looped_ms = time_call(
+        lambda: [tf.euler_matrix(0, beta, gamma, 'sxyz') for gamma in gammas], repeat)
+    batched_ms = time_call(
+        lambda: tf.euler_matrices(0, beta, gammas, 'sxyz'), repeat)
+
+    print "euler_matrix ({} matrices)".format(num_matrices)
+    print "\tLooped:  {:.3f} ms".format(looped_ms)
+    print "\tBatched: {:.3f} ms".format(batched_ms)
+    print "\tSpeedup: {:.1f}x".format(looped_ms / batched_ms)
+    print "\tMax abs difference: {}".format(np.max(np.abs(looped - batched)))
+
+
+def benchmark_trig_table(repeat):
+    """Compares polar to cartesian conversion via a trig lookup table against direct trig"""
+    columns = scan_utils.as_columnar(create_dummy_scan())
+    distance = columns.distance.astype(float)
+
+    direct_x, direct_y = scan_utils.polar_to_cartesian(distance, 0.001 * columns.angle)
+    direct_ms = time_call(
+        lambda: scan_utils.polar_to_cartesian(distance, 0.001 * columns.angle), repeat)
+
+    print "polar_to_cartesian ({} samples)".format(len(columns))
+    print "\tDirect trig: {:.3f} ms".format(direct_ms)
+
+    # 1 milli-degree (exact for integer angles), and 1/16 degree (the device's native resolution)
+    for resolution in [1, 62.5]:
+        trig_table = scan_utils.TrigTable(resolution)
+        x, y = trig_table.polar_to_cartesian(distance, columns.angle)
+        table_ms = time_call(
+            lambda: trig_table.polar_to_cartesian(distance, columns.angle), repeat)
+        print "\tLookup table ({} milli-deg resolution, {} entries):".format(
+            resolution, len(trig_table.cos))
+        print "\t\tTime:    {:.3f} ms ({:.1f}x)".format(table_ms, direct_ms / table_ms)
+        print "\t\tMax abs difference: {}".format(
+            max(np.max(np.abs(x - direct_x)), np.max(np.abs(y - direct_y))))
+        print "\t\tSamples with different rounded output: {}".format(
+            np.count_nonzero((np.round(x) != np.round(direct_x)) |
+                             (np.round(y) != np.round(direct_y))))
+
+
+def benchmark_session(repeat):
+    """Compares transforming a whole scan session at once against transforming sweep by sweep"""
+    num_sweeps = 100
+    scan = scan_utils.as_columnar(create_dummy_scan())
+    rotation_table = scan_utils.RotationTable(90, 0.9, num_sweeps)
+
+    session = scan_session.ScanSession(num_sweeps * len(scan))
+    for index in range(num_sweeps):
+        session.append(scan, index)
+
+    def transform_per_sweep():
+        """Transforms each sweep individually, as done during acquisition"""
+        return np.concatenate([scan_utils.transform_samples_with_matrices(
+            scan.angle, scan.distance, *rotation_table.get_matrices(index))
+                               for index in range(num_sweeps)])
+
+    per_sweep_coords = transform_per_sweep()
+    session_coords = session.transform(rotation_table)
+
+    per_sweep_ms = time_call(transform_per_sweep, repeat)
+    session_ms = time_call(lambda: session.transform(rotation_table), repeat)
+
+    print "Scan session ({} sweeps, {} samples)".format(num_sweeps, session.num_samples)
+    print "\tPer sweep: {:.3f} ms".format(per_sweep_ms)
+    print "\tSession:   {:.3f} ms".format(session_ms)
+    print "\tMax abs difference: {}".format(
+        np.max(np.abs(per_sweep_coords - session_coords)))
+
+
+def benchmark_deskew(repeat):
+    """Compares the vectorized per-sample deskew against building a rotation matrix per sample"""
+    scan = scan_utils.as_columnar(create_dummy_scan())
+    base_angles = scan_utils.interpolate_base_angles(scan.angle, 10, 10.9)
+
+    def deskew_per_sample():
+        """Transforms each sample with its own scan rotation matrix"""
+        x, y = scan_utils.polar_to_cartesian(
+            scan.distance.astype(float), 0.001 * scan.angle)
+        coords = np.zeros((len(scan), 4))
+        for n, base_angle in enumerate(base_angles):
+            rot_mat = scan_utils.get_scan_rotation_matrix(70, base_angle)
+            coords[n] = np.dot(rot_mat, [x[n], y[n], 0, 1])
+        return coords
+
+    per_sample_coords = deskew_per_sample()
+    coords = scan_utils.transform_samples_deskewed(scan.angle, scan.distance, 70, base_angles)
+
+    per_sample_ms = time_call(deskew_per_sample, repeat)
+    vectorized_ms = time_call(lambda: scan_utils.transform_samples_deskewed(
+        scan.angle, scan.distance, 70, base_angles), repeat)
+
+    print "transform_samples_deskewed ({} samples)".format(len(scan))
+    print "\tPer sample matrix: {:.3f} ms".format(per_sample_ms)
+    print "\tVectorized:        {:.3f} ms".format(vectorized_ms)
+    print "\tSpeedup:           {:.1f}x".format(per_sample_ms / vectorized_ms)
+    print "\tMax abs difference: {}".format(np.max(np.abs(per_sample_coords - coords)))
+
+
+def benchmark_export(repeat):
+    """Compares writing the CSV rows of a sweep in bulk against a DictWriter row per point"""
+    scan = scan_utils.as_columnar(create_dummy_scan())
+    coords = scan_utils.transform_samples(scan.angle, scan.distance, 90, 10, 11)
+    field_names = scan_exporter.ScanExporter.field_names
+
+    def export_per_row():
+        """Writes a dict per point, rounding each coordinate individually"""
+        output = StringIO.StringIO()
+        writer = csv.DictWriter(output, fieldnames=field_names)
+        for n, strength in enumerate(scan.signal_strength.tolist()):
+            writer.writerow({
+                'X': int(round(coords[n, 0])),
+                'Y': int(round(coords[n, 1])),
+                'Z': int(round(coords[n, 2])),
+                'SIGNAL_STRENGTH': strength
+            })
+        return output.getvalue()
+
+    def export_bulk():
+        """Writes all the rows of the sweep at once, as done by the ScanExporter"""
+        output = StringIO.StringIO()
+        scan_exporter.write_csv_rows(csv.writer(output), coords, scan.signal_strength)
+        return output.getvalue()
+
+    per_row_ms = time_call(export_per_row, repeat)
+    bulk_ms = time_call(export_bulk, repeat)
+
+    print "CSV export ({} samples)".format(len(scan))
+    print "\tPer row: {:.3f} ms".format(per_row_ms)
+    print "\tBulk:    {:.3f} ms".format(bulk_ms)
+    print "\tSpeedup: {:.1f}x".format(per_row_ms / bulk_ms)
+    print "\tIdentical output: {}".format(export_per_row() == export_bulk())
+
+
+def benchmark_motion(bus_latency):
+    """Compares the wall time and bus calls of base moves, using the dummy motor hat with a
+    simulated latency for each bus call"""
+    dummy_Adafruit_MotorHAT.Adafruit_MotorHAT.bus_latency = bus_latency
+    base = scanner_base.ScannerBase(use_dummy=True)
+    microstep = base.Adafruit_MotorHAT.MICROSTEP
+
+    def one_step_per_call(num_steps):
+        """Moves with a call to oneStep per micro-step (the original implementation)"""
+        phase_tables, base.phase_tables = base.phase_tables, {}
+        try:
+            base.move_steps(num_steps)
+        finally:
+            base.phase_tables = phase_tables
+
+    sweep_steps = int(round(base.get_steps_per_deg()))
+    transit_steps = base.get_num_steps_per_rev() // 4
+    moves = [
+        ("Move between sweeps ({} steps), oneStep".format(sweep_steps),
+         lambda: one_step_per_call(sweep_steps)),
+        ("Move between sweeps ({} steps), step train".format(sweep_steps),
+         lambda: base.move_steps(-sweep_steps)),
+        ("Transit ({} steps), oneStep".format(transit_steps),
+         lambda: one_step_per_call(transit_steps)),
+        ("Transit ({} steps), planned micro-steps".format(transit_steps),
+         lambda: base.move_planned(-transit_steps, style=microstep)),
+        ("Transit ({} steps), planned full steps".format(transit_steps),
+         lambda: base.move_planned(transit_steps)),
+    ]
+
+    print "base moves ({:.3f} ms per bus call)".format(1000.0 * bus_latency)
+    for name, move in moves:
+        num_records = len(base.motion_records)
+        move()
+        record = base.motion_records[num_records]
+        print "\t{}: {:.3f} ms, {} bus calls ({:.2f} per step)".format(
+            name, 1000.0 * record['duration'], record['bus_calls'],
+            1.0 * record['bus_calls'] / record['steps'])
+
+
+def main(arg_dict):
+    """Runs the requested benchmarks"""
+    repeat = int(arg_dict['repeat'])
+    if arg_dict['transform'] is True:
+        benchmark_transform(repeat)
+    if arg_dict['rotations'] is True:
+        benchmark_rotations(repeat)
+    if arg_dict['trig_table'] is True:
+        benchmark_trig_table(repeat)
+    if arg_dict['session'] is True:
+        benchmark_session(repeat)
+    if arg_dict['deskew'] is True:
+        benchmark_deskew(repeat)
+    if arg_dict['export'] is True:
+        benchmark_export(repeat)
+    if arg_dict['motion'] is True:
+        benchmark_motion(float(arg_dict['bus_latency']))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the scan processing routines')
+
+    parser.add_argument('--transform',
+                        help='Benchmark the transformation of a 2D scan to 3D coordinates',
+                        default=False,
+                        required=False,
+                        action='store_true')
+    parser.add_argument('--rotations',
+                        help='Benchmark building batches of rotation matrices',
+                        default=False,
+                        required=False,
+                        action='store_true')
+    parser.add_argument('--trig_table',
+                        help='Benchmark the accuracy and speed of the trig lookup table',
+                        default=False,
+                        required=False,
+                        action='store_true')
+    parser.add_argument('--session',
+                        help='Benchmark transforming an entire scan session at once',
+                        default=False,
+                        required=False,
+                        action='store_true')
+    parser.add_argument('--deskew',
+                        help='Benchmark the per-sample deskew of continuous rotation scans',
+                        default=False,
+                        required=False,
+                        action='store_true')
+    parser.add_argument('--export',
+                        help='Benchmark writing the CSV rows of a sweep',
+                        default=False,
+                        required=False,
+                        action='store_true')
+    parser.add_argument('--motion',
+                        help='Benchmark the base moves with the dummy motor hat',
+                        default=False,
+                        required=False,
+                        action='store_true')
+    parser.add_argument('--bus_latency',
+                        help='Simulated latency of each motor hat bus call in seconds (with --motion)',
+                        default=0.001,
+                        required=False)
+    parser.add_argument('-r', '--repeat',
+                        help='Number of times to repeat each measurement',
+                        default=20,
+                        required=False)
+
+    args = parser.parse_args()
+    argsdict = vars(args)
+
+    main(argsdict)
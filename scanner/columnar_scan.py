@@ -0,0 +1,103 @@
+"""Defines a compact, array backed container for the samples of a 2D scan"""
+import argparse
+import numpy as np
+
+
+class ColumnarScan(object):
+    """A 2D scan stored as one contiguous array per sample field (struct-of-arrays).
+    Attributes:
+        angle: the angle of each sample in milli-degrees (int32)
+        distance: the distance of each sample (uint16)
+        signal_strength: the signal strength of each sample (uint16)
+    """
+
+    def __init__(self, angle=None, distance=None, signal_strength=None):
+        """Return a ColumnarScan object
+        :param angle: array like of sample angles in milli-degrees, defaults to empty
+        :param distance: array like of sample distances, defaults to empty
+        :param signal_strength: array like of sample signal strengths, defaults to empty
+        """
+        if angle is None:
+            angle = []
+        if distance is None:
+            distance = []
+        if signal_strength is None:
+            signal_strength = []
+
+        self.angle = np.ascontiguousarray(angle, dtype=np.int32)
+        self.distance = np.ascontiguousarray(distance, dtype=np.uint16)
+        self.signal_strength = np.ascontiguousarray(
+            signal_strength, dtype=np.uint16)
+
+        if not len(self.angle) == len(self.distance) == len(self.signal_strength):
+            raise ValueError("Sample fields must all have the same length")
+
+    @classmethod
+    def from_scan(cls, scan):
+        """Returns a ColumnarScan built from a sweeppy (or dummy) Scan
+        :param scan: scan whose samples are (angle, distance, signal_strength) tuples
+        """
+        if not scan.samples:
+            return cls()
+        angle, distance, signal_strength = zip(*scan.samples)
+        # round the angles, in case they were provided as floats (ie: dummy scans)
+        return cls(np.rint(angle), distance, signal_strength)
+
+    def __len__(self):
+        """Returns the number of samples in the scan"""
+        return len(self.angle)
+
+    def keep(self, mask):
+        """Keeps only the samples selected by the mask
+        :param mask: boolean array with one entry per sample (True to keep the sample)
+        """
+        self.angle = self.angle[mask]
+        self.distance = self.distance[mask]
+        self.signal_strength = self.signal_strength[mask]
+
+    def copy(self):
+        """Returns an independent copy of the scan"""
+        return ColumnarScan(self.angle.copy(), self.distance.copy(),
+                            self.signal_strength.copy())
+
+    def to_samples(self, sample_type):
+        """Returns the samples as a list of sample_type objects (ie: sweeppy.Sample)
+        :param sample_type: callable accepting angle, distance and signal_strength keywords
+        """
+        return [sample_type(angle=angle, distance=distance, signal_strength=signal_strength)
+                for angle, distance, signal_strength in zip(
+                    self.angle.tolist(), self.distance.tolist(),
+                    self.signal_strength.tolist())]
+
+
+def main(arg_dict):
+    """Converts a dummy scan to a ColumnarScan and prints its contents"""
+    if arg_dict['use_dummy'] is True:
+        import dummy_sweeppy as sweeppy
+    else:
+        import sweeppy
+
+    dummy_samples = [sweeppy.Sample(angle=1000 * 30 * n, distance=10, signal_strength=199)
+                     for n in range(6)]
+    dummy_scan = sweeppy.Scan(samples=dummy_samples)
+
+    scan = ColumnarScan.from_scan(dummy_scan)
+    print len(scan)
+    print scan.angle
+    print scan.distance
+    print scan.signal_strength
+    print scan.to_samples(sweeppy.Sample)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Columnar Scan Testing')
+    parser.add_argument('-d', '--use_dummy',
+                        help='Use the dummy verison without hardware',
+                        default=False,
+                        action='store_true',
+                        required=False)
+
+    args = parser.parse_args()
+    argsdict = vars(args)
+
+    main(argsdict)
@@ -0,0 +1,131 @@
+"""Defines a tracker of the angular coverage of each base position during a 3D scan"""
+import argparse
+import numpy as np
+
+
+class CoverageTracker(object):
+    """Tracks which angular ranges of each base position are missing from the exported scan.
+    The samples of the sweep at index n before the 180 degree mark are taken at base position n,
+    and those after the mark at base position n + 1.
+    Coverage is tracked in angular bins, so that a position can be revisited and only the
+    samples falling in missing bins re-exported.
+    Attributes:
+        resolution: the width of each angular bin in degrees
+        missing: boolean array (num_positions, num_bins), True where coverage is missing
+    """
+
+    def __init__(self, num_positions, resolution=None):
+        """Return a CoverageTracker object
+        :param num_positions: the number of base positions in the scan (ie: num_sweeps + 1)
+        :param resolution: the width of each angular bin in degrees, defaults to 1
+        """
+        if resolution is None:
+            resolution = 1
+
+        self.resolution = resolution
+        num_bins = int(np.ceil(360.0 / resolution))
+        self.missing = np.zeros((int(num_positions), num_bins), dtype=bool)
+
+    def get_bins(self, angle_mdeg):
+        """Returns the bin index of each angle
+        :param angle_mdeg: array of angles in milli-degrees
+        """
+        bins = (np.asarray(angle_mdeg) / (1000.0 * self.resolution)).astype(np.intp)
+        return np.clip(bins, 0, self.missing.shape[1] - 1)
+
+    def get_range_bins(self, low, high, excluded_windows=None):
+        """Returns a boolean mask of the bins overlapping the open angular range (low, high),
+        ignoring the bins centered in any excluded window
+        :param low: the exclusive start of the range in milli-degrees
+        :param high: the exclusive end of the range in milli-degrees
+        :param excluded_windows: list of (low, high) windows in degrees never expected to be
+                                 covered (ie: the deadzone)
+        """
+        edges = 1000.0 * self.resolution * np.arange(self.missing.shape[1] + 1)
+        in_range = (edges[1:] > low) & (edges[:-1] < high)
+
+        centers = 0.5 * (edges[1:] + edges[:-1]) / 1000.0
+        for window_low, window_high in (excluded_windows or []):
+            in_range &= ~((centers >= window_low) & (centers <= window_high))
+        return in_range
+
+    def mark_missing(self, scan_index, low, high, excluded_windows=None):
+        """Marks an angular range of a sweep as missing
+        :param scan_index: the index of the sweep
+        :param low: the exclusive start of the range in milli-degrees
+        :param high: the exclusive end of the range in milli-degrees
+        :param excluded_windows: list of (low, high) windows in degrees which were never
+                                 expected to be covered for the sweep
+        """
+        # split the range at the 180 degree mark, where the base position changes
+        for position, (part_low, part_high) in [(scan_index, (low, min(high, 180000))),
+                                                (scan_index + 1, (max(low, 179999), high))]:
+            if part_low >= part_high or not 0 <= position < len(self.missing):
+                continue
+            self.missing[position] |= self.get_range_bins(
+                part_low, part_high, excluded_windows)
+
+    def record_sweep(self, scan_index, missing_ranges, excluded_windows=None):
+        """Records the angular ranges missing from an exported sweep
+        :param scan_index: the index of the sweep
+        :param missing_ranges: list of (low, high) open ranges in milli-degrees
+        :param excluded_windows: list of (low, high) windows in degrees which were never
+                                 expected to be covered for the sweep
+        """
+        for low, high in missing_ranges:
+            self.mark_missing(scan_index, low, high, excluded_windows)
+
+    def get_incomplete_positions(self):
+        """Returns the indices of the base positions with missing coverage"""
+        return np.flatnonzero(np.any(self.missing, axis=1)).tolist()
+
+    def get_missing_mask(self, position, angle_mdeg):
+        """Returns a boolean mask of the samples falling in missing bins of a base position
+        :param position: the index of the base position
+        :param angle_mdeg: array of sample angles in milli-degrees
+        """
+        return self.missing[position][self.get_bins(angle_mdeg)]
+
+    def record_refill(self, position, missing_ranges):
+        """Records that a base position was revisited with the base stationary. Only the
+        ranges missing both before and from the new sweep remain missing.
+        :param position: the index of the base position
+        :param missing_ranges: list of (low, high) open ranges (in milli-degrees) missing
+                               from the new sweep
+        """
+        still_missing = np.zeros(self.missing.shape[1], dtype=bool)
+        for low, high in missing_ranges:
+            still_missing |= self.get_range_bins(low, high)
+        self.missing[position] &= still_missing
+
+    def get_num_missing_bins(self):
+        """Returns the total number of missing bins across every base position"""
+        return int(np.count_nonzero(self.missing))
+
+
+def main(arg_dict):
+    """Records a few gaps, and prints the positions which must be revisited"""
+    deadzone = int(arg_dict['deadzone'])
+    tracker = CoverageTracker(11)
+    excluded_windows = [(deadzone, 360 - deadzone)]
+
+    # a gap before the 180 degree mark of sweep 2, and one spanning the deadzone of sweep 5
+    tracker.record_sweep(2, [(40000, 55000)], excluded_windows)
+    tracker.record_sweep(5, [(120000, 250000)], excluded_windows)
+
+    print tracker.get_incomplete_positions()
+    print tracker.get_num_missing_bins()
+    print tracker.get_missing_mask(2, np.array([30000, 45000, 50000, 60000]))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Coverage Tracker Testing')
+    parser.add_argument('-dz', '--deadzone',
+                        help='Starting angle of deadzone',
+                        default=135,
+                        required=False)
+
+    args = parser.parse_args()
+    argsdict = vars(args)
+
+    main(argsdict)
@@ -0,0 +1,217 @@
+"""Defines a scheduler which estimates the rotor phase of the sweep to time base moves"""
+import argparse
+import time
+import numpy as np
+import scan_settings
+from monotonic_clock import monotonic
+
+
+class DeadzoneScheduler(object):
+    """Estimates when the sweep sensor crosses the deadzone, from the arrival times of
+    successive sweeps and the configured motor speed, and waits precisely until then.
+    Records how late each base move actually started.
+    Attributes:
+        settings: the scan settings
+        latency: the delay (in sec) between the sensor crossing 0 deg and a sweep arriving
+        spin_time: the final portion of a wait (in sec) spent polling the clock instead of sleeping
+        max_arrivals: the number of recent arrivals used to estimate the rotor phase
+        arrivals: list of recent (revolution #, arrival time) pairs
+        fit: the (period, offset) fitted to the recent arrivals (None until computed)
+        lateness_edges_ms: the upper edges of the lateness histogram bins (in ms)
+        lateness_counts: the number of moves in each bin of the lateness histogram
+        lateness: list of all recorded lateness values (in sec)
+    """
+    lateness_edges_ms = [0.5, 1, 2, 5, 10, 20, 50, float('inf')]
+
+    def __init__(self, settings=None, latency=None, spin_time=None, max_arrivals=None):
+        """Return a DeadzoneScheduler object
+        :param settings: the scan settings
+        :param latency: delay (in sec) between crossing 0 deg and a sweep arriving, defaults to 0
+        :param spin_time: final portion (in sec) of a wait spent polling, defaults to 0 (polling
+                          holds the GIL, starving the worker threads on a single core,
+                          so by default waits only sleep and may end late by the wakeup jitter)
+        :param max_arrivals: # of recent arrivals used to estimate the rotor phase, defaults to 16
+        """
+        if settings is None:
+            settings = scan_settings.ScanSettings()
+        if latency is None:
+            latency = 0.0
+        if spin_time is None:
+            spin_time = 0.0
+        if max_arrivals is None:
+            max_arrivals = 16
+
+        self.settings = settings
+        self.latency = latency
+        self.spin_time = spin_time
+        self.max_arrivals = max_arrivals
+        self.arrivals = []
+        self.fit = None
+        self.lateness_counts = [0] * len(self.lateness_edges_ms)
+        self.lateness = []
+
+    def get_nominal_period(self):
+        """Returns the duration of a rotation (in sec) according to the configured motor speed"""
+        return 1.0 / self.settings.get_motor_speed()
+
+    def record_arrival(self, arrival_time=None):
+        """Records the arrival of a sweep and returns its arrival time.
+        Arrivals are numbered by revolution, so a missing sweep does not corrupt the estimate.
+        :param arrival_time: the arrival time on the monotonic clock, defaults to now
+        """
+        if arrival_time is None:
+            arrival_time = monotonic()
+
+        revolution = 0
+        if self.arrivals:
+            last_revolution, last_arrival_time = self.arrivals[-1]
+            elapsed_revolutions = int(round(
+                (arrival_time - last_arrival_time) / self.get_period()))
+            revolution = last_revolution + max(1, elapsed_revolutions)
+
+        self.arrivals.append((revolution, arrival_time))
+        if len(self.arrivals) > self.max_arrivals:
+            self.arrivals.pop(0)
+        # the arrivals changed, so the fit must be recomputed
+        self.fit = None
+        return arrival_time
+
+    def get_period(self):
+        """Returns the estimated duration of a rotation (in sec)"""
+        if len(self.arrivals) < 2:
+            return self.get_nominal_period()
+        return self._fit()[0]
+
+    def _fit(self):
+        """Returns the (period, offset) of the line best fitting the arrival times,
+        such that arrival time = offset + period * revolution #
+        (computed once per arrival)
+        """
+        if self.fit is None:
+            self.fit = self._compute_fit()
+        return self.fit
+
+    def _compute_fit(self):
+        """Fits a line to the arrival times, and returns its (period, offset)"""
+        revolutions, arrival_times = zip(*self.arrivals)
+        revolutions = np.array(revolutions, dtype=float)
+        arrival_times = np.array(arrival_times)
+        # fit relative to the first arrival, to preserve precision
+        period, offset = np.polyfit(
+            revolutions - revolutions[0], arrival_times - arrival_times[0], 1)
+        if period <= 0:
+            return self.get_nominal_period(), arrival_times[-1]
+        return period, arrival_times[0] + offset - period * revolutions[0]
+
+    def get_zero_crossing(self):
+        """Returns the estimated time the sensor crossed 0 deg, starting the current rotation"""
+        last_revolution, last_arrival_time = self.arrivals[-1]
+        if len(self.arrivals) < 2:
+            return last_arrival_time - self.latency
+        period, offset = self._fit()
+        return offset + period * last_revolution - self.latency
+
+    def get_deadzone_window(self):
+        """Returns the estimated times the sensor enters and leaves the deadzone
+        during the current rotation
+        """
+        zero_crossing = self.get_zero_crossing()
+        period = self.get_period()
+        deadzone = self.settings.get_deadzone()
+        return (zero_crossing + period * deadzone / 360.0,
+                zero_crossing + period * (360 - deadzone) / 360.0)
+
+    def wait_until_deadzone(self):
+        """Waits until the sensor reaches the deadzone during the current rotation.
+        Returns the estimated times the sensor enters and leaves the deadzone.
+        """
+        window = self.get_deadzone_window()
+        wait_until(window[0], self.spin_time)
+        return window
+
+    def record_move_start(self, target_time, start_time=None):
+        """Records how late a base move started relative to the target time
+        :param target_time: the time the move should have started (ie: entering the deadzone)
+        :param start_time: the time the move started on the monotonic clock, defaults to now
+        """
+        if start_time is None:
+            start_time = monotonic()
+        lateness = start_time - target_time
+        self.lateness.append(lateness)
+        for index, edge in enumerate(self.lateness_edges_ms):
+            if 1000 * lateness < edge:
+                self.lateness_counts[index] = self.lateness_counts[index] + 1
+                break
+
+    def get_stats(self):
+        """Returns the phase estimate and move start lateness as a json serializable dict"""
+        stats = {
+            'period_ms': round(1000 * self.get_period(), 3),
+            'lateness_histogram': {
+                'edges_ms': [str(edge) for edge in self.lateness_edges_ms],
+                'counts': list(self.lateness_counts)
+            }
+        }
+        if self.lateness:
+            lateness_ms = 1000 * np.array(self.lateness)
+            stats['lateness_mean_ms'] = round(float(np.mean(lateness_ms)), 3)
+            stats['lateness_max_ms'] = round(float(np.max(lateness_ms)), 3)
+        return stats
+
+
+def wait_until(target_time, spin_time=None):
+    """Waits until the monotonic clock reaches the target time.
+    Sleeps for the wait, optionally polling the clock for its final portion to avoid
+    oversleeping (at the cost of holding the GIL while polling).
+    :param target_time: the time to wait for (on the monotonic clock)
+    :param spin_time: final portion (in sec) of the wait spent polling, defaults to 0
+    """
+    if spin_time is None:
+        spin_time = 0.0
+
+    remaining = target_time - monotonic()
+    if remaining > spin_time:
+        time.sleep(remaining - spin_time)
+    if spin_time <= 0:
+        return
+    while monotonic() < target_time:
+        pass
+
+
+def main(arg_dict):
+    """Simulates sweeps arriving with jitter, and prints the resulting schedule statistics"""
+    settings = scan_settings.ScanSettings(motor_speed=int(arg_dict['motor_speed']))
+    scheduler = DeadzoneScheduler(settings)
+    period = 1.0 / settings.get_motor_speed()
+    jitter = float(arg_dict['jitter'])
+
+    start = monotonic()
+    for revolution in range(int(arg_dict['num_sweeps'])):
+        # simulate a sweep arriving late by a random amount of delivery jitter
+        wait_until(start + revolution * period + np.random.uniform(0, jitter))
+        scheduler.record_arrival()
+        start_time, _ = scheduler.wait_until_deadzone()
+        scheduler.record_move_start(start_time)
+
+    print scheduler.get_stats()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Deadzone Scheduler Testing')
+    parser.add_argument('-ms', '--motor_speed',
+                        help='Motor Speed (integer from 1:10)',
+                        default=5,
+                        required=False)
+    parser.add_argument('-n', '--num_sweeps',
+                        help='Number of sweeps to simulate',
+                        default=20,
+                        required=False)
+    parser.add_argument('-j', '--jitter',
+                        help='Max delivery jitter of a sweep (in sec)',
+                        default=0.01,
+                        required=False)
+
+    args = parser.parse_args()
+    argsdict = vars(args)
+
+    main(argsdict)
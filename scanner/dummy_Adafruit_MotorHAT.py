@@ -1,26 +1,91 @@
 """ Dummy implementation of Adafruit_MotorHAT """
 import time
+import collections
+
+
+class Adafruit_PWM:
+    """ Dummy PWM driver of the motor hat. Counts the calls made to it, and simulates the
+    latency of the I2C bus for each call """
+
+    def __init__(self, hat):
+        """ Docstring """
+        self.hat = hat
+
+    def setPWM(self, channel, on, off):
+        """ Each call writes the 4 registers of a channel over the I2C bus """
+        self.hat.count_call('setPWM')
+        if self.hat.bus_latency > 0:
+            time.sleep(self.hat.bus_latency)
 
 
 class Adafruit_StepperMotor:
     """ Docstring """
+    MICROSTEPS = 8
+    MICROSTEP_CURVE = [0, 50, 98, 142, 180, 212, 236, 250, 255]
 
     def __init__(self, controller, num, steps=200):
         """ Docstring """
-        pass
+        self.MC = controller
+        self.revsteps = steps
+        self.motornum = num
+        self.currentstep = 0
+
+        if num == 1:
+            self.PWMA, self.AIN2, self.AIN1 = 8, 9, 10
+            self.PWMB, self.BIN2, self.BIN1 = 13, 12, 11
+        else:
+            self.PWMA, self.AIN2, self.AIN1 = 2, 3, 4
+            self.PWMB, self.BIN2, self.BIN1 = 7, 6, 5
 
     def setSpeed(self, rpm):
         """ Docstring """
         pass
 
     def oneStep(self, dir, style):
-        """ Docstring """
-        time.sleep(0.01)
-        return 0
+        """ Simulates the phase changes and PWM writes of a step """
+        # only the steps driving the hat are counted (not those recorded by a stand-in
+        # controller, ie: to build the phase tables of step trains)
+        if isinstance(self.MC, Adafruit_MotorHAT):
+            self.MC.count_call('oneStep')
+        microsteps = self.MICROSTEPS
+        sign = 1 if dir == Adafruit_MotorHAT.FORWARD else -1
+        half_step = self.currentstep // (microsteps // 2)
+
+        if style == Adafruit_MotorHAT.MICROSTEP:
+            self.currentstep += sign
+        elif style == Adafruit_MotorHAT.INTERLEAVE:
+            self.currentstep += sign * (microsteps // 2)
+        elif (style == Adafruit_MotorHAT.DOUBLE) == (half_step % 2 == 1):
+            # go to the next odd (DOUBLE) or even (SINGLE) half step
+            self.currentstep += sign * microsteps
+        else:
+            self.currentstep += sign * (microsteps // 2)
+        self.currentstep %= microsteps * 4
+
+        pwm_a = pwm_b = 255
+        if style == Adafruit_MotorHAT.MICROSTEP:
+            quarter, offset = divmod(self.currentstep, microsteps)
+            rising = self.MICROSTEP_CURVE[offset]
+            falling = self.MICROSTEP_CURVE[microsteps - offset]
+            pwm_a, pwm_b = (falling, rising) if quarter % 2 == 0 else (rising, falling)
+            coils = [[1, 1, 0, 0], [0, 1, 1, 0], [0, 0, 1, 1], [1, 0, 0, 1]][quarter]
+        else:
+            coils = [[1, 0, 0, 0], [1, 1, 0, 0], [0, 1, 0, 0], [0, 1, 1, 0],
+                     [0, 0, 1, 0], [0, 0, 1, 1], [0, 0, 0, 1], [1, 0, 0, 1]][
+                         self.currentstep // (microsteps // 2)]
+
+        self.MC._pwm.setPWM(self.PWMA, 0, pwm_a * 16)
+        self.MC._pwm.setPWM(self.PWMB, 0, pwm_b * 16)
+        self.MC.setPin(self.AIN2, coils[0])
+        self.MC.setPin(self.BIN1, coils[1])
+        self.MC.setPin(self.AIN1, coils[2])
+        self.MC.setPin(self.BIN2, coils[3])
+        return self.currentstep
 
     def step(self, steps, direction, stepstyle):
         """ Docstring """
-        time.sleep(0.01 * steps)
+        for _ in range(steps):
+            self.oneStep(direction, stepstyle)
 
 
 class Adafruit_DCMotor:
@@ -28,15 +93,26 @@ class Adafruit_DCMotor:
 
     def __init__(self, controller, num):
         """ Docstring """
-        pass
+        self.MC = controller
+        self.PWMpin, self.IN2pin, self.IN1pin = [
+            (8, 9, 10), (13, 12, 11), (2, 3, 4), (7, 6, 5)][num - 1]
 
     def run(self, command):
         """ Docstring """
-        pass
+        self.MC.count_call('run')
+        if command == Adafruit_MotorHAT.FORWARD:
+            self.MC.setPin(self.IN2pin, 0)
+            self.MC.setPin(self.IN1pin, 1)
+        if command == Adafruit_MotorHAT.BACKWARD:
+            self.MC.setPin(self.IN1pin, 0)
+            self.MC.setPin(self.IN2pin, 1)
+        if command == Adafruit_MotorHAT.RELEASE:
+            self.MC.setPin(self.IN1pin, 0)
+            self.MC.setPin(self.IN2pin, 0)
 
     def setSpeed(self, speed):
         """Docstring"""
-        pass
+        self.MC._pwm.setPWM(self.PWMpin, 0, speed * 16)
 
 
 class Adafruit_MotorHAT:
@@ -51,19 +127,41 @@ class Adafruit_MotorHAT:
     INTERLEAVE = 3
     MICROSTEP = 4
 
+    # simulated latency of each call to the PWM driver (in seconds), ie: ~1ms to write the
+    # 4 registers of a channel over a 100kHz I2C bus
+    bus_latency = 0.001
+
     def __init__(self, addr=None, freq=None, i2c=None, i2c_bus=None):
         """ Docstring """
-        self.stepper = Adafruit_StepperMotor(None, None)
-        self.motor = Adafruit_DCMotor(None, None)
+        self.calls = collections.Counter()
+        self._pwm = Adafruit_PWM(self)
+        self.steppers = [Adafruit_StepperMotor(self, 1), Adafruit_StepperMotor(self, 2)]
+        self.motors = [Adafruit_DCMotor(self, n + 1) for n in range(4)]
+
+    def count_call(self, name):
+        """ Counts a call to the hat """
+        self.calls[name] += 1
+
+    def get_call_counts(self):
+        """ Returns the # of calls made to the hat, by name """
+        return dict(self.calls)
+
+    def reset_call_counts(self):
+        """ Resets the call counters """
+        self.calls.clear()
 
     def setPin(self, pin, value):
         """ Docstring """
-        pass
+        if value == 0:
+            self._pwm.setPWM(pin, 0, 4096)
+        if value == 1:
+            self._pwm.setPWM(pin, 4096, 0)
 
     def getStepper(self, steps, num):
         """ Docstring """
-        return self.stepper
+        self.steppers[num - 1].revsteps = steps
+        return self.steppers[num - 1]
 
     def getMotor(self, num):
         """ Docstring """
-        return self.motor
+        return self.motors[num - 1]
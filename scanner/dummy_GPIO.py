@@ -1,4 +1,5 @@
 """ Dummy version of GPIO """
+import threading
 from random import randint
 
 BCM = 1
@@ -18,9 +19,18 @@ def setup(pin=None, IO=None, pull_up_down=None):
     pass
 
 
+# pending simulated events, by pin
+_event_timers = {}
+
+
 def add_event_detect(pin=None, edge=None, callback=None, bouncetime=None):
     """ Docstring """
-    pass
+    # simulates an event shortly after subscribing, from a separate thread
+    if callback is not None:
+        timer = threading.Timer(0.01 * randint(1, 10), callback, [pin])
+        timer.daemon = True
+        _event_timers[pin] = timer
+        timer.start()
 
 
 def input(pin=None):
@@ -37,4 +47,6 @@ def event_detected(pin=None):
 
 def remove_event_detect(pin=None):
     """ Docstring """
-    pass
+    timer = _event_timers.pop(pin, None)
+    if timer is not None:
+        timer.cancel()
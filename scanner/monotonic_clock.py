@@ -0,0 +1,40 @@
+"""Provides a monotonic clock, which (unlike time.time) never jumps when the system time changes"""
+import time
+
+
+def _get_clock():
+    """Returns the best available monotonic clock function
+    (python 2 has no time.monotonic, so clock_gettime is called directly on linux)
+    """
+    if hasattr(time, 'monotonic'):
+        return time.monotonic
+
+    try:
+        import ctypes
+        import ctypes.util
+
+        class _Timespec(ctypes.Structure):
+            """struct timespec"""
+            _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+        librt = ctypes.CDLL(ctypes.util.find_library('rt') or 'librt.so.1', use_errno=True)
+        clock_gettime = librt.clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+        clock_monotonic = 1  # CLOCK_MONOTONIC on linux
+
+        def _monotonic():
+            """Returns the value (in fractional seconds) of the monotonic clock"""
+            timespec = _Timespec()
+            if clock_gettime(clock_monotonic, ctypes.byref(timespec)) != 0:
+                raise OSError(ctypes.get_errno(), "clock_gettime failed")
+            return timespec.tv_sec + timespec.tv_nsec * 1e-9
+
+        _monotonic()
+        return _monotonic
+    except (OSError, AttributeError):
+        # fall back on the system time
+        return time.time
+
+
+# Returns the value (in fractional seconds) of a monotonic clock
+monotonic = _get_clock()
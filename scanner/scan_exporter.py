@@ -4,26 +4,41 @@ import time
 import datetime
 import csv
 import os.path
+import cStringIO
+import numpy as np
 import scan_utils
+import scan_writer
 
 
 class ScanExporter(object):
-    """The scan exporter.
+    """The scan exporter. Scans are exported to a CSV file, or a binary PLY file if the
+    destination file has a .ply extension.
     Attributes:
         file_name: the name of the destination file for exported scans
-        file: the destination file for exported scans
+        file_format: the format of the destination file ('csv' or 'ply')
+        writer: the scan_writer.ScanWriter writing to the destination file
         field_names: the fields for storage
-        writer: the csv file writer
+        num_points: the number of points exported
+        rotation_table: the precomputed rotation matrices for each base position
+        trig_table: optional lookup table for the trig functions of the sample angles
     """
     # Output directory for the exported file
     output_dir = os.path.join(os.path.dirname(
         os.path.abspath(__file__)), '../output_scans')
     # Field names for the CSV
     field_names = ['X', 'Y', 'Z', 'SIGNAL_STRENGTH']
+    # Vertex layout of binary PLY files (matching the PLY files generated by the node app)
+    ply_dtype = np.dtype([('x', '<f4'), ('y', '<f4'), ('z', '<f4'), ('signal_strength', 'u1')])
 
-    def __init__(self, file_name=None):
+    def __init__(self, file_name=None, async_writes=False, flush_policy=None,
+                 flush_size=None, fsync=False):
         """Return a ScanExporter object
         :param file_name: the name of the destination file, defaults to a timestamp name
+        :param async_writes: if True, write to the file on a writer thread
+        :param flush_policy: when to flush the file ('sweep', 'size' or 'end'),
+                             defaults to 'end'
+        :param flush_size: the # of bytes between flushes with the 'size' policy
+        :param fsync: if True, force the file to disk on every flush
         """
         # default to timestamp file name
         if file_name is None:
@@ -32,44 +47,215 @@ class ScanExporter(object):
 
         #self.output_dir = os.path.split(file_name)[0]
         self.file_name = os.path.split(file_name)[1]
+        if os.path.splitext(self.file_name)[1].lower() == '.ply':
+            self.file_format = 'ply'
+        else:
+            self.file_format = 'csv'
+        self.num_points = 0
 
         # Create an output directory for the scans if it doesn't exit
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
 
         # Create the file
-        self.file = open(self.get_relative_file_path(), 'wb')
-        # Create a writer to write to the CSV file
-        self.writer = csv.DictWriter(self.file, fieldnames=self.field_names)
-        # Write the header to the CSV
-        self.writer.writeheader()
+        self.writer = scan_writer.ScanWriter(
+            self.get_relative_file_path(), async_writes, flush_policy, flush_size, fsync)
+        if self.file_format == 'ply':
+            # Reserve the header, the vertex count is patched in on close
+            self.writer.write(get_ply_header(0))
+        else:
+            # Write the header to the CSV
+            self.writer.write(",".join(self.field_names) + "\r\n")
+        # Precomputed rotation matrices for each base position
+        self.rotation_table = None
+        # Optional lookup table for the trig functions of the sample angles
+        self.trig_table = None
 
     def export_2D_scan(self, scan, scan_index, angle_between_sweeps, mount_angle, CCW):
         """Exports the scan to the file
-        :param scan:
+        :param scan: a Scan or ColumnarScan
         :param scan_index:
         :param mount_angle:
         :param angle_between_sweeps
         :param CCW: True if base rotates CCW during scan
         """
+        # accept both Scan and ColumnarScan objects
+        scan = scan_utils.as_columnar(scan)
+
+        converted_coords = self.transform_2D_scan(
+            scan, scan_index, angle_between_sweeps, mount_angle, CCW)
+
+        self.export_points(converted_coords, scan.signal_strength)
+
+    def transform_2D_scan(self, scan, scan_index, angle_between_sweeps, mount_angle, CCW):
+        """Returns the 3D cartesian coordinates of the samples of the scan, without exporting
+        :param scan: a Scan or ColumnarScan
+        :param scan_index:
+        :param mount_angle:
+        :param angle_between_sweeps
+        :param CCW: True if base rotates CCW during scan
+        """
+        # Rotation matrices for the base angles before and after base rotation
+        rotation_table = self.get_rotation_table(
+            mount_angle, angle_between_sweeps, CCW, scan_index)
+        rot_mat_1, rot_mat_2 = rotation_table.get_matrices(scan_index)
+
+        scan = scan_utils.as_columnar(scan)
+
+        return scan_utils.transform_samples_with_matrices(
+            scan.angle, scan.distance, rot_mat_1, rot_mat_2, self.trig_table)
+
+    def export_continuous_scan(self, scan, base_angle_1, base_angle_2, mount_angle, CCW):
+        """Exports a scan acquired while the base rotated continuously to the file
+        :param scan: a Scan or ColumnarScan
+        :param base_angle_1: the (unsigned) base angle when the sweep crossed 0 deg
+        :param base_angle_2: the (unsigned) base angle when the sweep crossed 360 deg
+        :param mount_angle:
+        :param CCW: True if base rotates CCW during scan
+        """
+        scan = scan_utils.as_columnar(scan)
+
+        converted_coords = self.transform_continuous_scan(
+            scan, base_angle_1, base_angle_2, mount_angle, CCW)
+
+        self.export_points(converted_coords, scan.signal_strength)
+
+    def transform_continuous_scan(self, scan, base_angle_1, base_angle_2, mount_angle, CCW):
+        """Returns the 3D cartesian coordinates of the samples of a scan acquired while the
+        base rotated continuously, with the base angle interpolated for every sample
+        :param scan: a Scan or ColumnarScan
+        :param base_angle_1: the (unsigned) base angle when the sweep crossed 0 deg
+        :param base_angle_2: the (unsigned) base angle when the sweep crossed 360 deg
+        :param mount_angle:
+        :param CCW: True if base rotates CCW during scan
+        """
+        scan = scan_utils.as_columnar(scan)
+
+        base_angles = scan_utils.interpolate_base_angles(
+            scan.angle, base_angle_1, base_angle_2)
+        if not CCW:
+            base_angles = -base_angles
+
+        return scan_utils.transform_samples_deskewed(
+            scan.angle, scan.distance, mount_angle, base_angles, self.trig_table)
+
+    def export_session(self, session, angle_between_sweeps, mount_angle, CCW):
+        """Transforms every sample buffered during a scan session in bulk, and exports them
+        :param session: a scan_session.ScanSession
+        :param angle_between_sweeps:
+        :param mount_angle:
+        :param CCW: True if base rotates CCW during scan
+        """
+        if session.num_samples == 0:
+            return
+
+        rotation_table = self.get_rotation_table(
+            mount_angle, angle_between_sweeps, CCW, session.get_num_sweeps() - 1)
+
+        converted_coords = session.transform(rotation_table, self.trig_table)
+
+        self.export_points(converted_coords, session.get_signal_strength())
+
+    def export_continuous_session(self, session, sweep_base_angles, mount_angle, CCW):
+        """Transforms every sample buffered during a continuous rotation scan session in bulk,
+        and exports them
+        :param session: a scan_session.ScanSession
+        :param sweep_base_angles: array like of the (unsigned) base angles when each sweep
+                                  crossed 0 and 360 deg, shape (num_sweeps, 2)
+        :param mount_angle:
+        :param CCW: True if base rotates CCW during scan
+        """
+        if session.num_samples == 0:
+            return
+
+        sweep_base_angles = np.asarray(sweep_base_angles, dtype=float)
         if not CCW:
-            angle_between_sweeps = -angle_between_sweeps
+            sweep_base_angles = -sweep_base_angles
+
+        converted_coords = session.transform_deskewed(
+            mount_angle, sweep_base_angles, self.trig_table)
+
+        self.export_points(converted_coords, session.get_signal_strength())
+
+    def export_points(self, converted_coords, signal_strength):
+        """Exports already transformed points to the file
+        :param converted_coords: array of (N, 4) homogeneous cartesian coordinates
+        :param signal_strength: array of the N signal strengths
+        """
+        self.num_points = self.num_points + len(signal_strength)
+        if self.file_format == 'ply':
+            self.export_ply_vertices(converted_coords, signal_strength)
+            return
 
-        # Base angle before base rotation
-        base_angle_1 = scan_index * angle_between_sweeps
-        # Base angle after base rotation
-        base_angle_2 = (scan_index + 1) * angle_between_sweeps
+        # format the rows of every point in memory, then hand them to the writer as a block
+        rows = cStringIO.StringIO()
+        write_csv_rows(csv.writer(rows), converted_coords, signal_strength)
+        self.writer.write(rows.getvalue())
 
-        converted_coords = scan_utils.transform_scan(
-            scan, mount_angle, base_angle_1, base_angle_2)
+    def export_ply_vertices(self, converted_coords, signal_strength):
+        """Writes already transformed points to the PLY file as a single packed block
+        :param converted_coords: array of (N, 4) homogeneous cartesian coordinates
+        :param signal_strength: array of the N signal strengths
+        """
+        vertices = np.empty(len(signal_strength), dtype=self.ply_dtype)
+        # rounded like the CSV, so both formats hold the same points
+        rounded_coords = round_coordinates(converted_coords)
+        vertices['x'] = rounded_coords[:, 0]
+        vertices['y'] = rounded_coords[:, 1]
+        vertices['z'] = rounded_coords[:, 2]
+        vertices['signal_strength'] = np.minimum(signal_strength, 255)
+        self.writer.write(vertices.tobytes())
+
+    def set_rotation_table(self, rotation_table):
+        """Sets the precomputed rotation matrices used to export the scans of a 3D scan
+        :param rotation_table: a scan_utils.RotationTable
+        """
+        self.rotation_table = rotation_table
+
+    def set_trig_table(self, trig_table):
+        """Sets the lookup table used for the trig functions of the sample angles
+        :param trig_table: a scan_utils.TrigTable, or None to compute them directly
+        """
+        self.trig_table = trig_table
 
-        for n, sample in enumerate(scan.samples):
-            self.writer.writerow({
-                'X': int(round(converted_coords[n, 0])),
-                'Y': int(round(converted_coords[n, 1])),
-                'Z': int(round(converted_coords[n, 2])),
-                'SIGNAL_STRENGTH': sample.signal_strength
-            })
+    def get_rotation_table(self, mount_angle, angle_between_sweeps, CCW, scan_index):
+        """Returns a rotation table for the specified parameters, covering the scan index.
+        The current table is reused if possible, otherwise a larger one is built.
+        :param mount_angle:
+        :param angle_between_sweeps:
+        :param CCW: True if base rotates CCW during scan
+        :param scan_index: the index of the scan which must be covered by the table
+        """
+        table = self.rotation_table
+        if (table is None or not table.matches(mount_angle, angle_between_sweeps, CCW)
+                or scan_index >= table.get_num_sweeps()):
+            num_sweeps = scan_index + 1
+            start_angle = 0
+            if table is not None and table.matches(mount_angle, angle_between_sweeps, CCW):
+                # grow geometrically, to avoid rebuilding the table for every new scan index
+                num_sweeps = max(num_sweeps, 2 * table.get_num_sweeps())
+                # keep the start angle (ie: of a scan starting where the previous one ended)
+                start_angle = table.start_angle
+            table = scan_utils.RotationTable(
+                mount_angle, angle_between_sweeps, num_sweeps, CCW, start_angle)
+            self.rotation_table = table
+        return table
+
+    def flush(self):
+        """Waits for every pending write, then flushes the destination file"""
+        self.writer.flush()
+
+    def close(self):
+        """Flushes and closes the destination file. The vertex count of a PLY file is
+        patched into its header."""
+        header = None
+        if self.file_format == 'ply':
+            header = get_ply_header(self.num_points)
+        self.writer.close(header)
+
+    def get_stats(self):
+        """Returns the metrics of the writes to the destination file"""
+        return self.writer.get_stats()
 
     def get_relative_file_path(self):
         """Returns the relative path of the destination file"""
@@ -80,6 +266,48 @@ class ScanExporter(object):
         return self.file_name
 
 
+def get_ply_header(num_points):
+    """Returns the header of a binary PLY file. The header has the same length whatever the
+    number of points, so it can be patched once every point is written.
+    :param num_points: the number of points (vertices) in the file
+    """
+    count = str(num_points)
+    count_width = 12
+    if len(count) > count_width:
+        raise ValueError("Too many points for the PLY header")
+    return ("ply\n"
+            "format binary_little_endian 1.0\n"
+            # pad the header to a fixed length
+            "comment sweep-3d-scanner" + " " * (count_width - len(count)) + "\n"
+            "element vertex " + count + "\n"
+            "property float x\n"
+            "property float y\n"
+            "property float z\n"
+            "property uchar signal_strength\n"
+            "end_header\n")
+
+
+def round_coordinates(converted_coords):
+    """Returns the x, y and z coordinates of the points rounded to the nearest integer
+    (halves away from zero, as python's round)
+    :param converted_coords: array of (N, 4) homogeneous cartesian coordinates
+    """
+    coords = np.asarray(converted_coords)[:, :3]
+    return np.copysign(np.floor(np.abs(coords) + 0.5), coords)
+
+
+def write_csv_rows(writer, converted_coords, signal_strength):
+    """Writes a CSV row per point, rounding every point at once and writing all the rows
+    in a single call
+    :param writer: a csv writer
+    :param converted_coords: array of (N, 4) homogeneous cartesian coordinates
+    :param signal_strength: array of the N signal strengths
+    """
+    rows = np.column_stack((round_coordinates(converted_coords).astype(np.int64),
+                            signal_strength))
+    writer.writerows(rows.tolist())
+
+
 def main(arg_dict):
     """Creates a ScanExporter and exports a dummy scan"""
     if arg_dict['use_dummy'] is True:
@@ -87,7 +315,7 @@ def main(arg_dict):
     else:
         import sweeppy
 
-    exporter = ScanExporter()
+    exporter = ScanExporter(file_name=arg_dict['output'])
 
     index = 0
     for base_angle_scalar in range(0, 13):
@@ -103,6 +331,8 @@ def main(arg_dict):
             False)
         index = index + 1
 
+    exporter.close()
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
         description='Scan Exporter Testing')
@@ -112,6 +342,11 @@ if __name__ == '__main__':
                         action='store_true',
                         required=False)
 
+    parser.add_argument('-o', '--output',
+                        help='Name of the exported file (.csv or .ply), defaults to a timestamp',
+                        default=None,
+                        required=False)
+
     args = parser.parse_args()
     argsdict = vars(args)
 
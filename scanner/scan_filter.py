@@ -0,0 +1,214 @@
+"""Defines a filter that removes unwanted samples from 2D scans in a single pass"""
+import argparse
+import numpy as np
+import scan_utils
+
+
+class ScanFilter(object):
+    """Combines every sample predicate (range limits, angular windows, ordering)
+    into a single boolean mask, and counts how many samples each rule rejected.
+    Scans containing unordered samples are salvaged by keeping their longest ordered runs.
+    Attributes:
+        min_range: the minimum distance for a sample to be kept
+        max_range: the maximum distance for a sample to be kept
+        angular_windows: dict of named (low, high) angular windows (in degrees) to remove
+        min_salvage_fraction: the minimum fraction of an unordered scan's samples which must
+                              be salvaged for the scan to be kept
+        rejection_counts: dict of the # of samples rejected by each rule
+        num_unordered_scans: the # of scans containing unordered samples
+        num_salvaged_scans: the # of unordered scans kept by salvaging their ordered runs
+        num_dropped_scans: the # of unordered scans discarded
+        missing_ranges: the (low, high) angular ranges (in milli-degrees) removed when
+                        salvaging the last evaluated scan
+    """
+
+    def __init__(self, min_range=None, max_range=None, angular_windows=None,
+                 min_salvage_fraction=None):
+        """Return a ScanFilter object
+        :param min_range: the minimum distance for a sample to be kept, defaults to 10
+        :param max_range: the maximum distance for a sample to be kept, defaults to 4000
+        :param angular_windows: dict of named (low, high) angular windows to remove
+        :param min_salvage_fraction: the minimum fraction of an unordered scan's samples which
+                                     must be salvaged to keep the scan, defaults to 0.5
+                                     (values above 1 discard every unordered scan)
+        """
+        if min_range is None:
+            min_range = 10
+        if max_range is None:
+            max_range = 4000
+        if angular_windows is None:
+            angular_windows = {}
+        if min_salvage_fraction is None:
+            min_salvage_fraction = 0.5
+
+        self.min_range = min_range
+        self.max_range = max_range
+        self.angular_windows = dict(angular_windows)
+        self.min_salvage_fraction = min_salvage_fraction
+        self.rejection_counts = {}
+        self.num_unordered_scans = 0
+        self.num_salvaged_scans = 0
+        self.num_dropped_scans = 0
+        self.missing_ranges = []
+        self.reset_counts()
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Returns a ScanFilter for the range limits and deadzone of the scan settings
+        :param settings: the scan settings
+        """
+        return cls(
+            min_range=settings.get_min_range_val(),
+            max_range=settings.get_max_range_val(),
+            angular_windows={'deadzone': (
+                settings.get_deadzone(), 360 - settings.get_deadzone())})
+
+    def set_angular_window(self, name, low, high):
+        """Adds (or replaces) a named angular window to remove from every scan
+        :param name: the name of the rule
+        :param low: the start of the window in degrees
+        :param high: the end of the window in degrees
+        """
+        self.angular_windows[name] = (low, high)
+        self.rejection_counts.setdefault(name, 0)
+
+    def compute_mask(self, scan, extra_windows=None):
+        """Returns the keep mask of the scan, and the # of samples rejected by each rule.
+        A sample is counted against every rule it fails.
+        :param scan: a Scan or ColumnarScan
+        :param extra_windows: dict of named (low, high) windows to remove from this scan only
+        """
+        columns = scan_utils.as_columnar(scan)
+        counts = {}
+
+        in_range = (columns.distance >= self.min_range) & \
+            (columns.distance <= self.max_range)
+        counts['distance'] = int(len(in_range) - np.count_nonzero(in_range))
+        mask = in_range
+
+        windows = dict(self.angular_windows)
+        if extra_windows:
+            windows.update(extra_windows)
+
+        # angle of samples is encoded in millidegrees
+        angle_deg = 0.001 * columns.angle
+        for name, (low, high) in windows.items():
+            in_window = (angle_deg >= low) & (angle_deg <= high)
+            counts[name] = int(np.count_nonzero(in_window))
+            mask &= ~in_window
+
+        return mask, counts
+
+    def apply(self, scan, extra_windows=None):
+        """Removes the rejected samples from the scan (in place).
+        Returns False if the remaining samples are unordered, and the scan should be discarded.
+        :param scan: a Scan or ColumnarScan
+        :param extra_windows: dict of named (low, high) windows to remove from this scan only
+        """
+        mask = self.evaluate(scan, extra_windows)
+        if mask is None:
+            return False
+
+        scan_utils.keep_samples(scan, mask)
+        return True
+
+    def evaluate(self, scan, extra_windows=None):
+        """Updates the rejection counters, and returns the keep mask of the scan
+        without modifying it. If the samples which would be kept are unordered, only their
+        longest ordered runs are kept, and the removed angular ranges are noted in
+        missing_ranges. Returns None if too few samples could be salvaged, and the scan
+        should be discarded.
+        :param scan: a Scan or ColumnarScan
+        :param extra_windows: dict of named (low, high) windows to remove from this scan only
+        """
+        mask, counts = self.compute_mask(scan, extra_windows)
+
+        for name, count in counts.items():
+            self.rejection_counts[name] = self.rejection_counts.get(
+                name, 0) + count
+
+        # Catch scans that contain unordered samples
+        # (this may indicate problem reading sync byte)
+        self.missing_ranges = []
+        kept_indices = np.flatnonzero(mask)
+        kept_angle = scan_utils.as_columnar(scan).angle[kept_indices]
+        if not scan_utils.contains_unordered_angles(kept_angle):
+            return mask
+
+        self.num_unordered_scans = self.num_unordered_scans + 1
+
+        # Salvage the longest ordered runs, unless too little of the scan would remain
+        salvaged = scan_utils.select_ordered_runs(kept_angle)
+        num_salvaged = int(np.count_nonzero(salvaged))
+        if num_salvaged == 0 or num_salvaged < self.min_salvage_fraction * len(kept_angle):
+            self.num_dropped_scans = self.num_dropped_scans + 1
+            self.rejection_counts['unordered'] = self.rejection_counts[
+                'unordered'] + len(kept_angle)
+            return None
+
+        self.num_salvaged_scans = self.num_salvaged_scans + 1
+        self.rejection_counts['unordered'] = self.rejection_counts[
+            'unordered'] + len(kept_angle) - num_salvaged
+        mask[kept_indices[~salvaged]] = False
+        self.missing_ranges = scan_utils.get_missing_ranges(kept_angle, salvaged)
+        return mask
+
+    def reset_counts(self):
+        """Resets the rejection counters"""
+        self.rejection_counts = {'distance': 0, 'unordered': 0}
+        for name in self.angular_windows:
+            self.rejection_counts[name] = 0
+        self.num_unordered_scans = 0
+        self.num_salvaged_scans = 0
+        self.num_dropped_scans = 0
+
+    def get_stats(self):
+        """Returns the rejection counters as a json serializable dict"""
+        return {
+            'rejected_samples': dict(self.rejection_counts),
+            'unordered_scans': self.num_unordered_scans,
+            'salvaged_scans': self.num_salvaged_scans,
+            'dropped_scans': self.num_dropped_scans
+        }
+
+
+def main(arg_dict):
+    """Filters a dummy scan and prints the results"""
+    if arg_dict['use_dummy'] is True:
+        import dummy_sweeppy as sweeppy
+    else:
+        import sweeppy
+
+    dummy_samples = [sweeppy.Sample(angle=1000 * 30 * n, distance=10 * n, signal_strength=199)
+                     for n in range(12)]
+    dummy_scan = sweeppy.Scan(samples=dummy_samples)
+
+    scan_filter = ScanFilter(min_range=10, max_range=100,
+                             angular_windows={'deadzone': (135, 225)})
+
+    print scan_filter.apply(dummy_scan, {'overlap': (135, 361)})
+    print dummy_scan.samples
+
+    # a scan with a corrupted stretch of samples (ie: a misread sync byte)
+    corrupted_samples = [sweeppy.Sample(angle=angle, distance=50, signal_strength=199)
+                         for angle in [0, 10000, 20000, 5000, 6000, 30000, 40000, 50000]]
+    corrupted_scan = sweeppy.Scan(samples=corrupted_samples)
+
+    print scan_filter.apply(corrupted_scan)
+    print corrupted_scan.samples
+    print scan_filter.missing_ranges
+    print scan_filter.get_stats()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Scan Filter Testing')
+    parser.add_argument('-d', '--use_dummy',
+                        help='Use the dummy verison without hardware',
+                        default=False,
+                        action='store_true',
+                        required=False)
+
+    args = parser.parse_args()
+    argsdict = vars(args)
+
+    main(argsdict)
@@ -0,0 +1,230 @@
+"""Defines a multi-threaded pipeline for processing scans off the acquisition thread"""
+import argparse
+import time
+import threading
+import Queue
+from monotonic_clock import monotonic
+
+# Marks the end of the stream of items passing through the pipeline
+_END_OF_STREAM = object()
+
+
+class QueueStats(object):
+    """Backpressure metrics of a bounded queue.
+    Attributes:
+        max_depth: the max # of items waiting in the queue
+        num_puts: the # of items put in the queue
+        num_blocked_puts: the # of puts which had to wait for space in the queue
+        blocked_time: the total time (in sec) spent waiting for space in the queue
+    """
+
+    def __init__(self):
+        """Return a QueueStats object"""
+        self.max_depth = 0
+        self.num_puts = 0
+        self.num_blocked_puts = 0
+        self.blocked_time = 0.0
+
+    def to_dict(self):
+        """Returns the metrics as a json serializable dict"""
+        return {
+            'max_depth': self.max_depth,
+            'puts': self.num_puts,
+            'blocked_puts': self.num_blocked_puts,
+            'blocked_ms': round(1000 * self.blocked_time, 3)
+        }
+
+
+class StageStats(object):
+    """Latency metrics of a pipeline stage.
+    Attributes:
+        num_items: the # of items processed by the stage
+        total_latency: the total time (in sec) spent processing items
+        max_latency: the longest time (in sec) spent processing a single item
+    """
+
+    def __init__(self):
+        """Return a StageStats object"""
+        self.num_items = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, latency):
+        """Records the time spent processing a single item
+        :param latency: the processing time in sec
+        """
+        self.num_items = self.num_items + 1
+        self.total_latency = self.total_latency + latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def to_dict(self):
+        """Returns the metrics as a json serializable dict"""
+        mean_latency = self.total_latency / self.num_items if self.num_items else 0.0
+        return {
+            'items': self.num_items,
+            'mean_ms': round(1000 * mean_latency, 3),
+            'max_ms': round(1000 * self.max_latency, 3)
+        }
+
+
+class BoundedQueue(object):
+    """A bounded FIFO queue which records backpressure metrics.
+    Attributes:
+        queue: the underlying queue
+        stats: the backpressure metrics
+    """
+
+    def __init__(self, maxsize):
+        """Return a BoundedQueue object
+        :param maxsize: the max # of items in the queue before puts block
+        """
+        self.queue = Queue.Queue(maxsize)
+        self.stats = QueueStats()
+
+    def put(self, item):
+        """Puts an item in the queue, waiting for space if the queue is full"""
+        try:
+            self.queue.put_nowait(item)
+        except Queue.Full:
+            t_0 = monotonic()
+            self.queue.put(item)
+            self.stats.num_blocked_puts = self.stats.num_blocked_puts + 1
+            self.stats.blocked_time = self.stats.blocked_time + \
+                (monotonic() - t_0)
+        if item is _END_OF_STREAM:
+            return
+        self.stats.num_puts = self.stats.num_puts + 1
+        self.stats.max_depth = max(self.stats.max_depth, self.queue.qsize())
+
+    def get(self):
+        """Removes and returns an item from the queue, waiting for one if necessary"""
+        return self.queue.get()
+
+
+class PipelineStage(threading.Thread):
+    """A worker thread applying a function to each item from its input queue,
+    and forwarding the result (unless it is None) to its output queue.
+    Attributes:
+        func: the function applied to each item
+        input_queue: the queue the items are received from
+        output_queue: the queue results are forwarded to (None for the last stage)
+        stats: the latency metrics of the stage
+        error: the first exception raised by func, if any
+    """
+
+    def __init__(self, name, func, input_queue, output_queue=None):
+        """Return a PipelineStage object
+        :param name: the name of the stage
+        :param func: function applied to each item
+        :param input_queue: the BoundedQueue the items are received from
+        :param output_queue: the BoundedQueue results are forwarded to
+        """
+        super(PipelineStage, self).__init__(name=name)
+        self.daemon = True
+        self.func = func
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.stats = StageStats()
+        self.error = None
+
+    def run(self):
+        """Processes items until the end of the stream"""
+        while True:
+            item = self.input_queue.get()
+            if item is _END_OF_STREAM:
+                break
+            # after an error, keep draining the input so that producers never block forever
+            if self.error is not None:
+                continue
+            t_0 = monotonic()
+            try:
+                result = self.func(item)
+            except Exception as error:  # pylint: disable=broad-except
+                self.error = error
+                continue
+            self.stats.record(monotonic() - t_0)
+            if result is not None and self.output_queue is not None:
+                self.output_queue.put(result)
+
+        if self.output_queue is not None:
+            self.output_queue.put(_END_OF_STREAM)
+
+
+class ScanPipeline(object):
+    """A chain of worker threads connected by bounded queues.
+    Items put in the pipeline pass through every stage in order.
+    Attributes:
+        queues: the input queue of each stage
+        stages: the worker threads
+    """
+
+    def __init__(self, stages, maxsize=None):
+        """Return a ScanPipeline object, and start its worker threads
+        :param stages: list of (name, func) tuples, in processing order
+        :param maxsize: the max # of items waiting for each stage, defaults to 4
+        """
+        if maxsize is None:
+            maxsize = 4
+
+        self.queues = [BoundedQueue(maxsize) for _ in stages]
+        self.stages = []
+        for index, (name, func) in enumerate(stages):
+            output_queue = None
+            if index + 1 < len(stages):
+                output_queue = self.queues[index + 1]
+            self.stages.append(PipelineStage(
+                name, func, self.queues[index], output_queue))
+
+        for stage in self.stages:
+            stage.start()
+
+    def put(self, item):
+        """Puts an item in the pipeline, waiting if the first stage is backed up"""
+        self.queues[0].put(item)
+
+    def close(self):
+        """Waits for every item to pass through the pipeline and stops the worker threads.
+        Raises the first error encountered by any stage.
+        """
+        self.queues[0].put(_END_OF_STREAM)
+        for stage in self.stages:
+            stage.join()
+        for stage in self.stages:
+            if stage.error is not None:
+                raise stage.error
+
+    def get_stats(self):
+        """Returns the queue and stage metrics as a json serializable dict"""
+        return {
+            'queues': dict((stage.name, queue.stats.to_dict())
+                           for stage, queue in zip(self.stages, self.queues)),
+            'stages': dict((stage.name, stage.stats.to_dict())
+                           for stage in self.stages)
+        }
+
+
+def main(arg_dict):
+    """Runs a few items through a pipeline with a slow final stage and prints the metrics"""
+    def slow_write(item):
+        """Simulates a slow disk write"""
+        time.sleep(float(arg_dict['delay']))
+
+    pipeline = ScanPipeline([('double', lambda item: 2 * item),
+                             ('write', slow_write)], maxsize=2)
+    for item in range(10):
+        pipeline.put(item)
+    pipeline.close()
+    print pipeline.get_stats()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Scan Pipeline Testing')
+    parser.add_argument('--delay',
+                        help='Time (in sec) the final stage takes to process each item',
+                        default=0.05,
+                        required=False)
+
+    args = parser.parse_args()
+    argsdict = vars(args)
+
+    main(argsdict)
@@ -0,0 +1,183 @@
+"""Defines a buffer holding the raw samples of an entire scan session"""
+import argparse
+import numpy as np
+import scan_utils
+
+
+class ScanSession(object):
+    """Preallocated buffer of the raw polar samples of every sweep in a scan, so that
+    the whole session can be transformed in bulk once acquisition has finished.
+    Attributes:
+        angle: the angle of each sample in milli-degrees (int32)
+        distance: the distance of each sample (uint16)
+        signal_strength: the signal strength of each sample (uint16)
+        sweep_index: the index of the sweep each sample belongs to (int32)
+        num_samples: the number of samples stored in the buffer
+    """
+
+    def __init__(self, capacity=None):
+        """Return a ScanSession object
+        :param capacity: the number of samples to preallocate, defaults to 100000
+        """
+        if capacity is None:
+            capacity = 100000
+
+        capacity = max(int(capacity), 1)
+        self.angle = np.empty(capacity, dtype=np.int32)
+        self.distance = np.empty(capacity, dtype=np.uint16)
+        self.signal_strength = np.empty(capacity, dtype=np.uint16)
+        self.sweep_index = np.empty(capacity, dtype=np.int32)
+        self.num_samples = 0
+
+    def get_capacity(self):
+        """Returns the number of samples the buffer can hold without growing"""
+        return len(self.angle)
+
+    def reserve(self, capacity):
+        """Grows the buffer (if required) to hold at least the specified number of samples
+        :param capacity: the number of samples
+        """
+        if capacity <= self.get_capacity():
+            return
+        # grow geometrically, to keep the number of reallocations small
+        capacity = max(capacity, 2 * self.get_capacity())
+        for name in ['angle', 'distance', 'signal_strength', 'sweep_index']:
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.num_samples] = old[:self.num_samples]
+            setattr(self, name, new)
+
+    def append(self, scan, sweep_index):
+        """Appends the samples of a 2D scan to the buffer
+        :param scan: a Scan or ColumnarScan
+        :param sweep_index: the index of the sweep
+        """
+        scan = scan_utils.as_columnar(scan)
+        start = self.num_samples
+        end = start + len(scan)
+        self.reserve(end)
+
+        self.angle[start:end] = scan.angle
+        self.distance[start:end] = scan.distance
+        self.signal_strength[start:end] = scan.signal_strength
+        self.sweep_index[start:end] = sweep_index
+        self.num_samples = end
+
+    def get_num_sweeps(self):
+        """Returns the number of sweeps covered by the buffered samples
+        (sweeps may be appended out of order, ie: when filling coverage gaps)
+        """
+        if self.num_samples == 0:
+            return 0
+        return int(np.max(self.sweep_index[:self.num_samples])) + 1
+
+    def get_signal_strength(self):
+        """Returns the signal strength of every buffered sample"""
+        return self.signal_strength[:self.num_samples]
+
+    def transform(self, rotation_table, trig_table=None, chunk_size=None):
+        """Converts every buffered sample to 3D cartesian coordinates
+        with a batched matrix multiplication.
+        :param rotation_table: a scan_utils.RotationTable covering every buffered sweep
+        :param trig_table: optional scan_utils.TrigTable used instead of computing cos/sin
+        :param chunk_size: max # of samples transformed per batch (bounds the memory
+                           used by intermediate arrays), defaults to 65536
+        """
+        if chunk_size is None:
+            chunk_size = 65536
+
+        coords = np.empty((self.num_samples, 4))
+        for start in range(0, self.num_samples, chunk_size):
+            end = min(start + chunk_size, self.num_samples)
+            angle = self.angle[start:end]
+
+            # the base moved in the deadzone, so samples past the 180 degree mark
+            # (180 deg = 180000 milli-deg) use the base position after the move
+            positions = self.sweep_index[start:end] + (angle >= 180000)
+
+            if trig_table is None:
+                # angles are in milli-degrees, and must be converted to degrees
+                x, y = scan_utils.polar_to_cartesian(
+                    self.distance[start:end].astype(float), 0.001 * angle)
+            else:
+                x, y = trig_table.polar_to_cartesian(
+                    self.distance[start:end], angle)
+
+            # build the homogeneous coordinates for every sample at once
+            chunk = coords[start:end]
+            chunk[:, 0] = x
+            chunk[:, 1] = y
+            chunk[:, 2] = 0
+            chunk[:, 3] = 1
+
+            # sweeps are buffered in order with their samples sorted by angle, so the samples
+            # of a base position are contiguous: transform each block with a single dot
+            # (revisited positions are simply separate blocks)
+            bounds = np.concatenate(([0], np.flatnonzero(np.diff(positions)) + 1,
+                                     [end - start]))
+            for block_start, block_end in zip(bounds[:-1], bounds[1:]):
+                matrix = rotation_table.matrices[positions[block_start]]
+                chunk[block_start:block_end] = np.dot(chunk[block_start:block_end], matrix.T)
+
+        return coords
+
+    def transform_deskewed(self, mount_angle, sweep_base_angles, trig_table=None,
+                           chunk_size=None):
+        """Converts every buffered sample of a continuous rotation scan to 3D cartesian
+        coordinates, interpolating the base angle of each sample.
+        :param mount_angle: the mount angle of the scanner relative to the horizontal
+        :param sweep_base_angles: array of the base angles when each sweep crossed
+                                  0 and 360 deg, shape (num_sweeps, 2)
+        :param trig_table: optional scan_utils.TrigTable used instead of computing cos/sin
+        :param chunk_size: max # of samples transformed per batch (bounds the memory
+                           used by intermediate arrays), defaults to 65536
+        """
+        if chunk_size is None:
+            chunk_size = 65536
+
+        sweep_base_angles = np.asarray(sweep_base_angles, dtype=float)
+
+        coords = np.empty((self.num_samples, 4))
+        for start in range(0, self.num_samples, chunk_size):
+            end = min(start + chunk_size, self.num_samples)
+            angle = self.angle[start:end]
+            sweep_index = self.sweep_index[start:end]
+
+            base_angles = scan_utils.interpolate_base_angles(
+                angle, sweep_base_angles[sweep_index, 0], sweep_base_angles[sweep_index, 1])
+            coords[start:end] = scan_utils.transform_samples_deskewed(
+                angle, self.distance[start:end], mount_angle, base_angles, trig_table)
+
+        return coords
+
+
+def main(arg_dict):
+    """Buffers a few dummy scans and transforms them all at once"""
+    if arg_dict['use_dummy'] is True:
+        import dummy_sweeppy as sweeppy
+    else:
+        import sweeppy
+
+    session = ScanSession(capacity=10)
+    for index in range(4):
+        dummy_samples = [sweeppy.Sample(angle=1000 * 60 * n, distance=1000, signal_strength=199)
+                         for n in range(6)]
+        session.append(sweeppy.Scan(samples=dummy_samples), index)
+
+    rotation_table = scan_utils.RotationTable(90, 30, session.get_num_sweeps())
+    print session.num_samples
+    print session.transform(rotation_table)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Scan Session Testing')
+    parser.add_argument('-d', '--use_dummy',
+                        help='Use the dummy verison without hardware',
+                        default=False,
+                        action='store_true',
+                        required=False)
+
+    args = parser.parse_args()
+    argsdict = vars(args)
+
+    main(argsdict)
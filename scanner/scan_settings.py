@@ -1,4 +1,5 @@
 """Holds parameters and settings for 3D the scanner."""
+import math
 import sweep_helpers
 
 
@@ -114,6 +115,10 @@ class ScanSettings(object):
         """Returns the resolution which results from the settings in samples/deg"""
         return 1.0 * self.sample_rate / (self.motor_speed * 360)
 
+    def get_samples_per_sweep(self):
+        """Returns the expected number of samples in a single 2D sweep"""
+        return int(math.ceil(1.0 * self.sample_rate / self.motor_speed))
+
     def get_step_size_deg(self):
         """Returns the ideal base step size (in degrees) required to match the
         horizontal & vertical resolutions
@@ -128,6 +133,12 @@ class ScanSettings(object):
         """Returns the time required for sensor to travel between 0 deg and deadzone (in sec)"""
         return self.deadzone / (360.0 * self.motor_speed)
 
+    def get_time_to_deadzone_end_sec(self):
+        """Returns the time required for sensor to travel between 0 deg and the end of the
+        deadzone (in sec)
+        """
+        return (360 - self.deadzone) / (360.0 * self.motor_speed)
+
     def print_details(self):
         """Prints info about this scan parameters object"""
         print "ScanSettings Object"
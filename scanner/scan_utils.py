@@ -1,7 +1,9 @@
 """Defines utility methods related to 3D scans"""
 import argparse
+import bisect
 import numpy as np
 import transformations as tf
+from columnar_scan import ColumnarScan
 
 
 def polar_to_cartesian(radius, angle_deg):
@@ -17,63 +19,114 @@ def polar_to_cartesian(radius, angle_deg):
 
 
 def transform_scan(scan, mount_angle, base_angle_1, base_angle_2):
-    """test
+    """Converts the samples of a 2D scan to 3D cartesian coordinates
+    :param scan: the 2D scan, a Scan or ColumnarScan (samples must be ordered by angle)
     :param mount_angle: the mount angle of the scanner relative to the horizontal
     :param base_angle_1: the angle of the base before moving
     :param base_angle_2: the angle of the base after moving
     """
+    columns = as_columnar(scan)
+    return transform_samples(columns.angle, columns.distance,
+                             mount_angle, base_angle_1, base_angle_2)
 
+
+def transform_samples(angles, distances, mount_angle, base_angle_1, base_angle_2):
+    """Converts arrays of polar samples to 3D cartesian coordinates in a single pass
+    :param angles: array of sample angles in milli-degrees (must be in ascending order)
+    :param distances: array of sample distances
+    :param mount_angle: the mount angle of the scanner relative to the horizontal
+    :param base_angle_1: the angle of the base before moving
+    :param base_angle_2: the angle of the base after moving
+    """
     rot_mat_1 = get_scan_rotation_matrix(mount_angle, base_angle_1)
     rot_mat_2 = get_scan_rotation_matrix(mount_angle, base_angle_2)
 
-    num_samples = len(scan.samples)
+    return transform_samples_with_matrices(angles, distances, rot_mat_1, rot_mat_2)
+
+
+def transform_samples_with_matrices(angles, distances, rot_mat_1, rot_mat_2, trig_table=None):
+    """Converts arrays of polar samples to 3D cartesian coordinates using precomputed matrices
+    :param angles: array of sample angles in milli-degrees (must be in ascending order)
+    :param distances: array of sample distances
+    :param rot_mat_1: the rotation matrix for the 1st half of the scan (before moving the base)
+    :param rot_mat_2: the rotation matrix for the 2nd half of the scan (after moving the base)
+    :param trig_table: optional TrigTable used instead of computing cos/sin of every sample
+    """
+    angles = np.asarray(angles)
 
     # determine the index of the first reading past the 180 degree mark
-    start_index_2 = num_samples
-    for index, sample in enumerate(scan.samples):
-        # Find first reading of the 2nd half of the scan
-        # (180 deg = 180000 milli-deg)
-        if sample.angle >= 180000:
-            start_index_2 = index
-            break
-
-    # Divide the samples about the 180 deg mark
-    num_samples_1 = start_index_2
-    num_samples_2 = len(scan.samples) - start_index_2
-
-    array_size = (num_samples, 4)
-    array_size_1 = (num_samples_1, 4)
-    array_size_2 = (num_samples_2, 4)
-
-    coords = np.zeros(array_size)
-    coords_1 = np.zeros(array_size_1)
-    coords_2 = np.zeros(array_size_2)
-
-    for index, sample in enumerate(scan.samples):
-        # sample.angle is in milli-degrees, and must be converted to degrees
-        cartesian_coord = polar_to_cartesian(
-            sample.distance, 0.001 * sample.angle)
-        homogeneous_coord = np.array(
-            [cartesian_coord[0], cartesian_coord[1], 0, 1])
-
-        if sample.angle < 180000:
-            coords_1[index] = homogeneous_coord
-        else:
-            coords_2[index - num_samples_1] = homogeneous_coord
+    # (180 deg = 180000 milli-deg)
+    start_index_2 = np.searchsorted(angles, 180000, side='left')
+
+    if trig_table is None:
+        # angles are in milli-degrees, and must be converted to degrees
+        x, y = polar_to_cartesian(np.asarray(distances, dtype=float), 0.001 * angles)
+    else:
+        x, y = trig_table.polar_to_cartesian(distances, angles)
+
+    # build the homogeneous coordinates for every sample at once
+    coords = np.zeros((len(angles), 4))
+    coords[:, 0] = x
+    coords[:, 1] = y
+    coords[:, 3] = 1
 
     # transform each half of the scan with the appropriate base angle
-    coords_1 = np.dot(coords_1, rot_mat_1.T)
-    coords_2 = np.dot(coords_2, rot_mat_2.T)
+    coords[:start_index_2] = np.dot(coords[:start_index_2], rot_mat_1.T)
+    coords[start_index_2:] = np.dot(coords[start_index_2:], rot_mat_2.T)
+
+    return coords
+
+
+def transform_samples_deskewed(angles, distances, mount_angle, base_angles, trig_table=None):
+    """Converts arrays of polar samples to 3D cartesian coordinates, where every sample
+    has its own base angle (ie: the base rotated while the scan was acquired)
+    :param angles: array of sample angles in milli-degrees
+    :param distances: array of sample distances
+    :param mount_angle: the mount angle of the scanner relative to the horizontal
+    :param base_angles: array of the base angle (in degrees) of each sample
+    :param trig_table: optional TrigTable used instead of computing cos/sin of every sample
+    """
+    angles = np.asarray(angles)
+
+    if trig_table is None:
+        # angles are in milli-degrees, and must be converted to degrees
+        x, y = polar_to_cartesian(np.asarray(distances, dtype=float), 0.001 * angles)
+    else:
+        x, y = trig_table.polar_to_cartesian(distances, angles)
 
-    # combine the transformed halves into a single array of coordinates
-    for i in range(0, num_samples_1):
-        coords[i] = coords_1[i]
-    for i in range(num_samples_1, num_samples):
-        coords[i] = coords_2[i - num_samples_1]
+    # The scan rotation matrix is the base rotation (about z) applied after the mount
+    # rotation, so the mount rotation is shared by every sample...
+    mount_mat = get_scan_rotation_matrix(mount_angle, 0)
+    mounted_x = mount_mat[0, 0] * x + mount_mat[0, 1] * y
+    mounted_y = mount_mat[1, 0] * x + mount_mat[1, 1] * y
+
+    # ...and only the rotation about z differs between samples
+    gamma = np.deg2rad(base_angles)
+    cos_gamma = np.cos(gamma)
+    sin_gamma = np.sin(gamma)
+
+    coords = np.empty((len(angles), 4))
+    coords[:, 0] = cos_gamma * mounted_x - sin_gamma * mounted_y
+    coords[:, 1] = sin_gamma * mounted_x + cos_gamma * mounted_y
+    coords[:, 2] = mount_mat[2, 0] * x + mount_mat[2, 1] * y
+    coords[:, 3] = 1
 
     return coords
 
 
+def interpolate_base_angles(angles, base_angle_1, base_angle_2):
+    """Returns the base angle of each sample of a scan acquired while the base rotated at a
+    constant rate. The rotor also spins at a constant rate, so the time of a sample within
+    the rotation is proportional to its angle.
+    :param angles: array of sample angles in milli-degrees
+    :param base_angle_1: the angle of the base when the rotation started (0 deg)
+    :param base_angle_2: the angle of the base when the rotation ended (360 deg)
+                         (either may be an array with one entry per sample)
+    """
+    fraction = np.asarray(angles) / 360000.0
+    return base_angle_1 + fraction * (np.asarray(base_angle_2) - base_angle_1)
+
+
 def get_scan_rotation_matrix(mount_angle, base_angle):
     """Creates a rotation matrix from mount and base angles
     :param mount_angle:
@@ -86,29 +139,246 @@ def get_scan_rotation_matrix(mount_angle, base_angle):
     return tf.euler_matrix(alpha, beta, gamma, 'sxyz')
 
 
+def get_scan_rotation_matrices(mount_angle, base_angles):
+    """Creates stacked rotation matrices (N, 4, 4) from a mount angle and an array of base angles
+    :param mount_angle:
+    :param base_angles: array like of base angles (in degrees)
+    """
+    alpha = 0                       # rotation about y (roll)
+    # negate mount_angle
+    beta = np.deg2rad(-mount_angle)  # rotation about x (pitch, mount_angle)
+    gammas = np.deg2rad(base_angles)  # rotation about z (yaw, base_angle)
+    return tf.euler_matrices(alpha, beta, gammas, 'sxyz')
+
+
+def as_columnar(scan):
+    """Returns the scan as a ColumnarScan (the scan itself if it already is one)
+    :param scan: a Scan (list of samples) or ColumnarScan
+    """
+    if isinstance(scan, ColumnarScan):
+        return scan
+    return ColumnarScan.from_scan(scan)
+
+
+def keep_samples(scan, mask):
+    """Keeps only the samples of the scan selected by the mask
+    :param scan: a Scan (list of samples) or ColumnarScan
+    :param mask: boolean array with one entry per sample (True to keep the sample)
+    """
+    if isinstance(scan, ColumnarScan):
+        scan.keep(mask)
+    else:
+        scan.samples[:] = [sample for sample, keep in zip(scan.samples, mask) if keep]
+
+
+class TrigTable(object):
+    """Precomputed cosine and sine values for sample angles (milli-degrees), so that a polar to
+    cartesian conversion is reduced to table lookups and multiplications.
+    Attributes:
+        resolution: the angular spacing of the table entries in milli-degrees
+        cos: the cosine of each table entry
+        sin: the sine of each table entry
+    """
+
+    def __init__(self, resolution=None):
+        """Return a TrigTable object
+        :param resolution: spacing of the table entries in milli-degrees, defaults to 62.5
+                           (the device's native 1/16 degree angle quantization, so the table
+                           only holds 5760 entries). A resolution of 1 is exact for any
+                           integer milli-degree angle, but holds 360000 entries (~5.8 MB).
+        """
+        if resolution is None:
+            resolution = 62.5
+
+        self.resolution = resolution
+        num_entries = int(round(360000.0 / resolution))
+        theta = np.deg2rad(0.001 * resolution * np.arange(num_entries))
+        self.cos = np.cos(theta)
+        self.sin = np.sin(theta)
+
+    def get_indices(self, angle_mdeg):
+        """Returns the table indices of the angles
+        :param angle_mdeg: array of angles in milli-degrees
+        """
+        angle_mdeg = np.asarray(angle_mdeg)
+        if self.resolution == 1 and angle_mdeg.dtype.kind in 'iu':
+            indices = angle_mdeg
+        else:
+            indices = np.rint(angle_mdeg / float(self.resolution)).astype(np.intp)
+        return indices % len(self.cos)
+
+    def polar_to_cartesian(self, radius, angle_mdeg):
+        """Converts polar coordinate samples to cartesian coordinates
+        :param radius: array of sample distances
+        :param angle_mdeg: array of sample angles in milli-degrees
+        """
+        indices = self.get_indices(angle_mdeg)
+        radius = np.asarray(radius, dtype=float)
+        return (radius * self.cos[indices], radius * self.sin[indices])
+
+
+class RotationTable(object):
+    """The scan rotation matrices for every base position of a scan, computed once up front.
+    The matrices for the scan at index n are those of base positions n and n + 1.
+    Attributes:
+        mount_angle: the mount angle of the scanner relative to the horizontal
+        angle_between_sweeps: the (unsigned) angle the base moves between sweeps
+        CCW: True if base rotates CCW during scan
+        start_angle: the base angle of the first base position
+        matrices: array of shape (num_positions, 4, 4), one rotation matrix per base position
+    """
+
+    def __init__(self, mount_angle, angle_between_sweeps, num_sweeps, CCW=False,
+                 start_angle=None):
+        """Return a RotationTable object
+        :param mount_angle: the mount angle of the scanner relative to the horizontal
+        :param angle_between_sweeps: the angle the base moves between sweeps
+        :param num_sweeps: the number of sweeps in the scan
+        :param CCW: True if base rotates CCW during scan
+        :param start_angle: the base angle of the first base position (ie: a scan which starts
+                            where the previous one ended), defaults to 0
+        """
+        if start_angle is None:
+            start_angle = 0
+
+        self.mount_angle = mount_angle
+        self.angle_between_sweeps = angle_between_sweeps
+        self.CCW = CCW
+        self.start_angle = start_angle
+
+        signed_angle = angle_between_sweeps if CCW else -angle_between_sweeps
+        base_angles = start_angle + signed_angle * np.arange(int(num_sweeps) + 1)
+        self.matrices = get_scan_rotation_matrices(mount_angle, base_angles)
+
+    def get_num_sweeps(self):
+        """Returns the number of sweeps covered by the table"""
+        return len(self.matrices) - 1
+
+    def get_matrices(self, scan_index):
+        """Returns the rotation matrices before and after the base move of the specified scan
+        :param scan_index: the index of the scan
+        """
+        return self.matrices[scan_index], self.matrices[scan_index + 1]
+
+    def matches(self, mount_angle, angle_between_sweeps, CCW):
+        """Returns true if the table was built for the specified parameters"""
+        return (self.mount_angle == mount_angle and
+                self.angle_between_sweeps == angle_between_sweeps and
+                self.CCW == CCW)
+
+
 def remove_distance_extremes(scan, low, high):
     """Removes samples from the scan whose ranges are outside the specified range"""
-    scan.samples[:] = [sample for sample in scan.samples if (
-        sample.distance >= low and sample.distance <= high)]
+    distance = as_columnar(scan).distance
+    keep_samples(scan, (distance >= low) & (distance <= high))
 
 
 def remove_angular_window(scan, low, high):
     """Removes samples from the scan whose angles are within the specified range"""
     # angle of samples is encoded in millidegrees
-    scan.samples[:] = [sample for sample in scan.samples if (
-        0.001 * sample.angle < low or 0.001 * sample.angle > high)]
+    angle_deg = 0.001 * as_columnar(scan).angle
+    keep_samples(scan, (angle_deg < low) | (angle_deg > high))
 
 
 def contains_unordered_samples(scan):
     """Returns true if the scan contains unordered samples
         (ie: no sample in the scan has an azimuth less than or equal to the preceding sample.)
     """
-    previous_angle = -1
-    for index, sample in enumerate(scan.samples):
-        if sample.angle <= previous_angle:
-            return True
-        previous_angle = sample.angle
-    return False
+    return contains_unordered_angles(as_columnar(scan).angle)
+
+
+def contains_unordered_angles(angle):
+    """Returns true if the array of sample angles (milli-degrees) is not strictly increasing
+    :param angle: array of sample angles
+    """
+    if len(angle) == 0:
+        return False
+    return bool(angle[0] < 0 or np.any(np.diff(angle) <= 0))
+
+
+def select_ordered_runs(angle, min_run_length=None):
+    """Returns a mask keeping the ordered runs of sample angles which can be salvaged from an
+    unordered scan: the runs (split at every descent, or invalid sample) are kept whole, and
+    chained in order such that every run starts at a greater angle than the preceding run ends,
+    maximizing the # of samples kept. A scan whose valid samples are all in order is kept whole.
+    :param angle: array of sample angles in milli-degrees
+    :param min_run_length: the min # of samples of a salvaged run, defaults to 3 (shorter runs
+                           can't be told apart from corrupted samples which happen to be
+                           in order)
+    """
+    if min_run_length is None:
+        min_run_length = 3
+
+    angle = np.asarray(angle)
+    # samples outside of a rotation are never valid
+    in_rotation = (angle >= 0) & (angle < 360000)
+    valid = np.flatnonzero(in_rotation)
+    if not np.any(np.diff(angle[valid]) <= 0):
+        return in_rotation
+
+    # split the valid samples into runs at every descent, or gap left by invalid samples
+    breaks = np.flatnonzero((np.diff(angle[valid]) <= 0) | (np.diff(valid) > 1)) + 1
+    starts = valid[np.concatenate(([0], breaks))]
+    ends = valid[np.concatenate((breaks - 1, [len(valid) - 1]))] + 1
+    long_enough = ends - starts >= min_run_length
+    starts = starts[long_enough]
+    ends = ends[long_enough]
+    firsts = angle[starts].tolist()
+    lasts = angle[ends - 1].tolist()
+
+    # chain the runs in O(R log R): a binary indexed tree over the ranks of the runs' last
+    # angles holds the best (# of samples, run) of the chains ending at each rank, so the best
+    # chain a run can extend is a prefix max over the ranks of the angles below its start
+    sorted_lasts = sorted(set(lasts))
+    tree = [(0, -1)] * (len(sorted_lasts) + 1)
+    previous = []
+    best = (0, -1)
+    for run, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+        prior = (0, -1)
+        rank = bisect.bisect_left(sorted_lasts, firsts[run])
+        while rank > 0:
+            prior = max(prior, tree[rank])
+            rank = rank - (rank & -rank)
+        previous.append(prior[1])
+        chain = (prior[0] + end - start, run)
+        best = max(best, chain)
+
+        rank = bisect.bisect_left(sorted_lasts, lasts[run]) + 1
+        while rank < len(tree):
+            tree[rank] = max(tree[rank], chain)
+            rank = rank + (rank & -rank)
+
+    keep = np.zeros(len(angle), dtype=bool)
+    run = best[1]
+    while run >= 0:
+        keep[starts[run]:ends[run]] = True
+        run = previous[run]
+    return keep
+
+
+def get_missing_ranges(angle, keep):
+    """Returns the angular ranges left uncovered by removing samples from a scan, as a list of
+    (low, high) angles in milli-degrees, bounded by the neighbouring kept samples
+    (or the start/end of the rotation)
+    :param angle: array of sample angles in milli-degrees
+    :param keep: boolean array with one entry per sample (True if the sample is kept)
+    """
+    angle = np.asarray(angle)
+    kept = np.flatnonzero(keep)
+    removed = np.flatnonzero(~np.asarray(keep, dtype=bool))
+    if len(removed) == 0:
+        return []
+
+    # group the removed samples into contiguous stretches
+    boundaries = np.flatnonzero(np.diff(removed) > 1) + 1
+    missing_ranges = []
+    for stretch in np.split(removed, boundaries):
+        before = kept[kept < stretch[0]]
+        after = kept[kept > stretch[-1]]
+        low = int(angle[before[-1]]) if len(before) else 0
+        high = int(angle[after[0]]) if len(after) else 360000
+        missing_ranges.append((low, high))
+    return missing_ranges
 
 
 def main(arg_dict):
@@ -0,0 +1,260 @@
+"""Defines a file writer which can write to disk off the acquisition thread"""
+import argparse
+import os
+import threading
+from monotonic_clock import monotonic
+import scan_pipeline
+# Marks the end of the stream of blocks written to the file
+from scan_pipeline import _END_OF_STREAM
+
+# Requests a flush of the file, once every block before it is written
+_FLUSH = object()
+
+
+class WriterStats(object):
+    """Metrics of the writes to a file.
+    Attributes:
+        num_bytes: the # of bytes written
+        num_writes: the # of blocks written
+        num_flushes: the # of flushes of the file
+        num_fsyncs: the # of fsyncs of the file
+        write_time: the total time (in sec) spent writing blocks
+        flush_time: the total time (in sec) spent flushing (and syncing) the file
+        max_stall: the longest time (in sec) spent writing or flushing a single block
+    """
+
+    def __init__(self):
+        """Return a WriterStats object"""
+        self.num_bytes = 0
+        self.num_writes = 0
+        self.num_flushes = 0
+        self.num_fsyncs = 0
+        self.write_time = 0.0
+        self.flush_time = 0.0
+        self.max_stall = 0.0
+
+    def to_dict(self):
+        """Returns the metrics as a json serializable dict"""
+        return {
+            'bytes': self.num_bytes,
+            'writes': self.num_writes,
+            'flushes': self.num_flushes,
+            'fsyncs': self.num_fsyncs,
+            'write_ms': round(1000 * self.write_time, 3),
+            'flush_ms': round(1000 * self.flush_time, 3),
+            'max_stall_ms': round(1000 * self.max_stall, 3)
+        }
+
+
+class ScanWriter(object):
+    """Writes blocks of data to a file, either directly or on a writer thread fed by a
+    bounded queue, and flushes the file according to a policy:
+        'sweep': after every block (ie: every exported sweep)
+        'size': every time flush_size bytes were written since the last flush
+        'end': only when the writer is flushed explicitly or closed
+    Attributes:
+        file: the destination file
+        flush_policy: when the file is flushed ('sweep', 'size' or 'end')
+        flush_size: the # of bytes written between flushes (with the 'size' policy)
+        fsync: if True, every flush also forces the file to disk with os.fsync
+        queue: the bounded queue of blocks waiting to be written (None if synchronous)
+        thread: the writer thread (None if synchronous)
+        stats: the write metrics
+        error: the first exception raised while writing, if any
+    """
+    flush_policies = ['sweep', 'size', 'end']
+
+    def __init__(self, file_path, async_writes=False, flush_policy=None, flush_size=None,
+                 fsync=False, maxsize=None):
+        """Return a ScanWriter object, and start its writer thread if writes are async
+        :param file_path: the path of the destination file
+        :param async_writes: if True, write on a writer thread instead of the caller's
+        :param flush_policy: when to flush the file ('sweep', 'size' or 'end'),
+                             defaults to 'end'
+        :param flush_size: the # of bytes between flushes with the 'size' policy,
+                           defaults to 1 MB
+        :param fsync: if True, force the file to disk on every flush
+        :param maxsize: the max # of blocks waiting to be written before writes block,
+                        defaults to 16
+        """
+        if flush_policy is None:
+            flush_policy = 'end'
+        if flush_policy not in self.flush_policies:
+            raise ValueError("Unknown flush policy: {}".format(flush_policy))
+        if flush_size is None:
+            flush_size = 1024 * 1024
+        if maxsize is None:
+            maxsize = 16
+
+        self.file = open(file_path, 'wb')
+        self.flush_policy = flush_policy
+        self.flush_size = max(int(flush_size), 1)
+        self.fsync = fsync
+        self.stats = WriterStats()
+        self.error = None
+        # the # of bytes written since the last flush
+        self.unflushed_bytes = 0
+
+        self.queue = None
+        self.thread = None
+        if async_writes:
+            self.queue = scan_pipeline.BoundedQueue(maxsize)
+            self.thread = threading.Thread(target=self._run, name='writer')
+            self.thread.daemon = True
+            self.thread.start()
+
+    def write(self, data):
+        """Writes a block of data to the file (queues it if writes are async).
+        Raises the first error encountered by the writer thread.
+        :param data: the block of data (str)
+        """
+        self.raise_error()
+        if self.queue is None:
+            self._write(data)
+        else:
+            self.queue.put(data)
+
+    def flush(self):
+        """Waits for every pending block to be written, then flushes the file (and forces it
+        to disk if fsync is enabled). Raises the first error encountered while writing.
+        """
+        if self.queue is None:
+            self._flush()
+        elif self.thread.is_alive():
+            self.queue.put(_FLUSH)
+            # the writer thread signals once it has flushed the file
+            self.queue.queue.join()
+        self.raise_error()
+
+    def close(self, header=None):
+        """Writes every pending block, then flushes and closes the file.
+        Raises the first error encountered while writing.
+        :param header: optional data overwriting the start of the file before it is closed
+                       (ie: a header patched once the size of the data is known)
+        """
+        if self.file.closed:
+            return
+        if self.queue is not None and self.thread.is_alive():
+            self.queue.put(_END_OF_STREAM)
+            self.thread.join()
+        try:
+            if header is not None and self.error is None:
+                self.file.seek(0)
+                self.file.write(header)
+                self.file.seek(0, os.SEEK_END)
+            if self.error is None:
+                self._flush()
+        finally:
+            self.file.close()
+        self.raise_error()
+
+    def raise_error(self):
+        """Raises the first error encountered while writing, if any"""
+        if self.error is not None:
+            raise self.error
+
+    def get_stats(self):
+        """Returns the write metrics as a json serializable dict"""
+        stats = self.stats.to_dict()
+        stats['flush_policy'] = self.flush_policy
+        stats['fsync'] = self.fsync
+        if self.queue is not None:
+            stats['queue'] = self.queue.stats.to_dict()
+        return stats
+
+    def _run(self):
+        """Writes blocks from the queue until the end of the stream"""
+        while True:
+            data = self.queue.get()
+            try:
+                if data is _END_OF_STREAM:
+                    break
+                # after an error, keep draining the queue so that writes never block forever
+                if self.error is not None:
+                    continue
+                try:
+                    if data is _FLUSH:
+                        self._flush()
+                    else:
+                        self._write(data)
+                except Exception as error:  # pylint: disable=broad-except
+                    self.error = error
+            finally:
+                self.queue.queue.task_done()
+
+    def _write(self, data):
+        """Writes a block of data to the file, and flushes it as required by the policy"""
+        t_0 = monotonic()
+        self.file.write(data)
+        elapsed = monotonic() - t_0
+        self.stats.num_bytes = self.stats.num_bytes + len(data)
+        self.stats.num_writes = self.stats.num_writes + 1
+        self.stats.write_time = self.stats.write_time + elapsed
+        self.stats.max_stall = max(self.stats.max_stall, elapsed)
+        self.unflushed_bytes = self.unflushed_bytes + len(data)
+
+        if self.flush_policy == 'sweep' or \
+                (self.flush_policy == 'size' and self.unflushed_bytes >= self.flush_size):
+            self._flush()
+
+    def _flush(self):
+        """Flushes the file, and forces it to disk if fsync is enabled"""
+        t_0 = monotonic()
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+            self.stats.num_fsyncs = self.stats.num_fsyncs + 1
+        elapsed = monotonic() - t_0
+        self.stats.num_flushes = self.stats.num_flushes + 1
+        self.stats.flush_time = self.stats.flush_time + elapsed
+        self.stats.max_stall = max(self.stats.max_stall, elapsed)
+        self.unflushed_bytes = 0
+
+
+def main(arg_dict):
+    """Writes a few dummy sweeps with the requested policy and prints the metrics"""
+    writer = ScanWriter(arg_dict['output'],
+                        async_writes=arg_dict['async_writes'],
+                        flush_policy=arg_dict['flush'],
+                        flush_size=int(float(arg_dict['flush_mb']) * 1024 * 1024),
+                        fsync=arg_dict['fsync'])
+    row = "1000,0,0,199\r\n"
+    t_0 = monotonic()
+    for _ in range(100):
+        writer.write(row * 1000)
+    print "Time spent writing: {:.3f} ms".format(1000 * (monotonic() - t_0))
+    writer.close()
+    print writer.get_stats()
+    os.remove(arg_dict['output'])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Scan Writer Testing')
+    parser.add_argument('-o', '--output',
+                        help='Path of the file to write (deleted afterwards)',
+                        default='scan_writer_test.csv',
+                        required=False)
+    parser.add_argument('--async_writes',
+                        help='Write on a writer thread',
+                        default=False,
+                        action='store_true',
+                        required=False)
+    parser.add_argument('--flush',
+                        help='When to flush the file',
+                        choices=ScanWriter.flush_policies,
+                        default='end',
+                        required=False)
+    parser.add_argument('--flush_mb',
+                        help='MB written between flushes (with --flush size)',
+                        default=1,
+                        required=False)
+    parser.add_argument('--fsync',
+                        help='Force the file to disk on every flush',
+                        default=False,
+                        action='store_true',
+                        required=False)
+
+    args = parser.parse_args()
+    argsdict = vars(args)
+
+    main(argsdict)
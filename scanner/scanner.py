@@ -3,13 +3,22 @@ import argparse
 import time
 import datetime
 import math
+import os.path
 import threading
+import numpy as np
 import sweep_helpers
 import scan_settings
 import scan_exporter
+import scan_writer
 import scan_utils
+import scan_filter
+import scan_session
+import scan_pipeline
+import deadzone_scheduler
+import coverage_tracker
 import scanner_base
 from scanner_output import output_json_message
+from monotonic_clock import monotonic
 
 
 class Scanner(object):
@@ -19,14 +28,37 @@ class Scanner(object):
         device: the sweep scanning LiDAR
         settings: the scan settings
         exporter: the scan exporter
+        deferred_transform: if True, the scan is transformed after acquisition
+        pipelined: if True, sweeps are processed on worker threads
+        async_moves: if True, the base is moved on a motion thread
+        continuous: if True, the base rotates continuously during the scan
+        fill_gaps: if True, base positions with missing coverage are revisited after the scan
+        latency: the delay (in sec) between the sensor crossing 0 deg and a sweep arriving
+        scheduler: estimates when the sensor reaches the deadzone during a scan
+        setup_stats: how the device was setup (cold or warm start) and how long it took,
+                     until reported by the next scan
     """
 
-    def __init__(self, device=None, base=None, settings=None, exporter=None):
+    def __init__(self, device=None, base=None, settings=None, exporter=None,
+                 deferred_transform=False, pipelined=False, async_moves=False,
+                 continuous=False, fill_gaps=False, latency=None):
         """Return a Scanner object
         :param base:  the scanner base
         :param device: the sweep device
         :param settings: the scan settings
         :param exporter: the scan exporter
+        :param deferred_transform: if True, only buffer the raw samples during the scan,
+                                   and transform + export them all after scanning stops
+        :param pipelined: if True, process sweeps on worker threads instead of the thread
+                          reading from the device
+        :param async_moves: if True, move the base on a motion thread, while the next sweep
+                            is acquired, and flag sweeps where a move overran the deadzone
+        :param continuous: if True, rotate the base at a constant rate instead of moving it
+                           in the deadzone, and interpolate the base angle of every sample
+        :param fill_gaps: if True, revisit the base positions with missing coverage (ie: from
+                          dropped or partially salvaged sweeps) once the main pass is complete
+        :param latency: the delay (in sec) between the sensor crossing 0 deg and a sweep
+                        arriving, used to schedule the base moves earlier, defaults to 0
         """
         if device is None:
             self.shutdown()
@@ -41,40 +73,85 @@ class Scanner(object):
         self.device = device
         self.settings = settings
         self.exporter = exporter
+        self.deferred_transform = deferred_transform
+        self.pipelined = pipelined
+        self.async_moves = async_moves
+        self.continuous = continuous
+        self.fill_gaps = fill_gaps
+        self.latency = latency
+        self.scheduler = None
+        self.setup_stats = None
         self.received_scan = False
 
     def setup_base(self):
-        """Setup the base"""
+        """Setup the base. The slow homing routine is skipped if the position of the base is
+        known (ie: restored from the state persisted by the last clean shutdown)"""
+        if self.base.position_confident:
+            output_json_message(
+                {'type': "update", 'status': "setup", 'msg': "Returning base to home position."})
+            self.base.move_to_angle(0)
+            return
+
         output_json_message(
             {'type': "update", 'status': "setup", 'msg': "Resetting base to home position."})
         self.base.reset()
 
     def setup_device(self):
-        """Setup the device"""
+        """Setup the device. The reset is skipped (warm start) if the device is already
+        responsive with a stable motor, and only the settings which differ are changed.
+        Returns true for a warm start.
+        """
         reset_max_duration = 11.0
 
-        output_json_message({'type': "update", 'status': "setup",
-                             'msg': "Resetting device.", 'duration': reset_max_duration})
+        warm_start = self.is_device_ready()
+        if not warm_start:
+            output_json_message({'type': "update", 'status': "setup",
+                                 'msg': "Resetting device.", 'duration': reset_max_duration})
 
-        # Reset the device
-        self.device.reset()
+            # Reset the device
+            self.device.reset()
 
-        # sleep for at least the minimum time required to reset the device
-        time.sleep(reset_max_duration)
+            # sleep for at least the minimum time required to reset the device
+            # (it does not respond while rebooting)
+            time.sleep(reset_max_duration)
 
         output_json_message(
             {'type': "update", 'status': "setup", 'msg': "Adjusting device settings."})
 
         # Set the sample rate
-        self.device.set_sample_rate(self.settings.get_sample_rate())
+        if not warm_start or self.device.get_sample_rate() != self.settings.get_sample_rate():
+            self.device.set_sample_rate(self.settings.get_sample_rate())
 
         # Set the motor speed
-        self.device.set_motor_speed(self.settings.get_motor_speed())
+        if not warm_start or self.device.get_motor_speed() != self.settings.get_motor_speed():
+            self.device.set_motor_speed(self.settings.get_motor_speed())
+
+        return warm_start
+
+    def is_device_ready(self):
+        """Returns true if the device responds to queries and its motor speed is stable
+        (ie: it was left idle by a previous scan), so that it need not be reset"""
+        try:
+            return self.device.get_motor_ready() is True
+        except Exception:  # pylint: disable=broad-except
+            # ie: the device is still streaming data from an interrupted scan
+            return False
 
     def setup(self):
-        """Setup the scanner according to the scan settings"""
+        """Setup the scanner according to the scan settings.
+        The base is homed while the device resets and calibrates, as they are independent.
+        """
+        start_time = monotonic()
+
+        # setup the base on a separate thread
+        base_setup = {}
+        base_thread = threading.Thread(
+            target=self._run_setup_base, args=(base_setup,), name='setup_base')
+        base_thread.daemon = True
+        base_thread.start()
+
         # setup the device, wait for it to calibrate
-        self.setup_device()
+        warm_start = self.setup_device()
 
         # wait until the device is ready, so as not to disrupt the calibration
         while True:
@@ -86,84 +163,474 @@ class Scanner(object):
                                  'msg': "Waiting for calibration routine and motor speed to stabilize."})
 
             time.sleep(0.5)
+        device_duration = monotonic() - start_time
 
-        # setup the base
-        self.setup_base()
+        output_json_message({'type': "update", 'status': "setup",
+                             'msg': "Device ready ({} start).".format(
+                                 "warm" if warm_start else "cold"),
+                             'duration': round(device_duration, 3)})
+
+        # wait until the base is setup as well, before any scan
+        base_thread.join()
+        if 'error' in base_setup:
+            raise base_setup['error']
+
+        self.setup_stats = {
+            'start': "warm" if warm_start else "cold",
+            'device_duration': round(device_duration, 3),
+            'base_duration': round(base_setup['duration'], 3),
+            'duration': round(monotonic() - start_time, 3)
+        }
+
+    def _run_setup_base(self, result):
+        """Sets up the base, noting the duration (or the error encountered) in the result
+        :param result: dict receiving the 'duration' or 'error' of the setup
+        """
+        start_time = monotonic()
+        try:
+            self.setup_base()
+        except Exception as error:  # pylint: disable=broad-except
+            result['error'] = error
+            return
+        result['duration'] = monotonic() - start_time
 
-    def perform_scan(self):
-        """Performs a 3d scan"""
+    def perform_scan(self, CCW=False):
+        """Performs a 3d scan, starting from the current base position
+        :param CCW: True to rotate the base CCW (ie: back towards the home position) during
+                    the scan, defaults to False
+        """
         # Calcualte some intermediate values
         num_sweeps, angle_between_sweeps, steps_per_move = self.calculate_scan_variables()
+        # positive moves rotate the base CW
+        if CCW:
+            steps_per_move = -steps_per_move
+
+        # The motion stats of the base only cover this scan's moves (not those of a previous
+        # scan, or of homing the base before it)
+        self.base.reset_motion_stats()
+
+        # The base angle where the scan starts (ie: where the previous scan ended)
+        start_position = self.base.get_position()
+        start_angle = -1.0 * start_position / self.base.get_steps_per_deg()
 
         # Report that the scan is initiating, and start scanning
         self.report_scan_initiated(num_sweeps)
         self.device.start_scanning()
 
-        # put a 3 second timeout on the get_scans() method in case it hangs
+        # put a 3 second timeout on the get_scans() method in case it hangs (reset for every
+        # scan, so the timeout also covers follow-up scans)
+        self.received_scan = False
         time_out_thread = threading.Timer(3, self.check_get_scan_timeout)
         time_out_thread.start()
 
         valid_scan_index = 0
         rotated_already = False
 
+        # the base move in progress, and its deadline (async moves only)
+        pending_move = None
+        # indices of the sweeps acquired while the base was still moving
+        overrun_sweeps = []
+
+        # estimates the rotor phase from the arrival of each sweep
+        self.scheduler = deadzone_scheduler.DeadzoneScheduler(self.settings,
+                                                               latency=self.latency)
+
+        # removes unwanted samples from every scan
+        sample_filter = scan_filter.ScanFilter.from_settings(self.settings)
+
+        # compute the rotation matrices for every base position up front
+        self.exporter.set_rotation_table(scan_utils.RotationTable(
+            self.settings.get_mount_angle(), angle_between_sweeps, num_sweeps, CCW,
+            start_angle))
+
+        # buffer for the raw samples of the whole scan (deferred transform only)
+        session = None
+        if self.deferred_transform:
+            session = scan_session.ScanSession(
+                num_sweeps * self.settings.get_samples_per_sweep())
+
+        # the angular ranges of each base position missing from the export
+        # (base positions are only discrete when the base moves between sweeps)
+        coverage = None
+        if not self.continuous:
+            coverage = coverage_tracker.CoverageTracker(num_sweeps + 1)
+        # true if the base moved while a discarded sweep was acquired, in which case the
+        # next sweep is entirely acquired at the following base position
+        front_misplaced = False
+
+        # base angles when each sweep crossed 0 and 360 deg (continuous deferred transform only)
+        sweep_base_angles = []
+
+        # worker threads which process valid sweeps (pipelined only)
+        pipeline = None
+        if self.pipelined:
+            pipeline = self.create_pipeline(num_sweeps, angle_between_sweeps, CCW, session)
+
         # get_scans is coroutine-based generator returning scans ad infinitum
-        for scan_count, scan in enumerate(self.device.get_scans()):
+        scans = self.device.get_scans()
+        for scan_count, scan in enumerate(scans):
             # note the arrival time
-            scan_arrival_time = time.time()
+            self.scheduler.record_arrival()
 
             # note that a scan was received (used to avoid the timeout)
             self.received_scan = True
 
-            # remove readings from unreliable distances
-            scan_utils.remove_distance_extremes(
-                scan, self.settings.get_min_range_val(), self.settings.get_max_range_val())
+            # The base move dispatched during the previous sweep should have finished
+            # before the sensor left the deadzone
+            move_overran = False
+            if pending_move is not None:
+                move_overran = self.check_move_overrun(*pending_move)
+                pending_move = None
 
-            # Remove readings from the deadzone
-            scan_utils.remove_angular_window(
-                scan, self.settings.get_deadzone(), 360 - self.settings.get_deadzone())
+            # convert the samples to contiguous arrays once, for all subsequent processing
+            scan = scan_utils.as_columnar(scan)
 
+            # Avoid redundant data in last few partially overlapping scans
+            extra_windows = None
             if valid_scan_index >= num_sweeps - 2:
-                # Avoid redundant data in last few partially overlapping scans
-                scan_utils.remove_angular_window(
-                    scan, self.settings.get_deadzone(), 361)
+                extra_windows = {'overlap': (self.settings.get_deadzone(), 361)}
 
-            # Catch scans that contain unordered samples and discard them
+            # Find readings from unreliable distances and from the deadzone in a single pass.
+            # Only keep the longest ordered runs of scans that contain unordered samples,
+            # and discard the scan if too little can be salvaged
             # (this may indicate problem reading sync byte)
-            if scan_utils.contains_unordered_samples(scan):
+            mask = sample_filter.evaluate(scan, extra_windows)
+            if mask is None:
+                if rotated_already:
+                    front_misplaced = True
                 continue
 
             # Edge case (discard 1st scan without base movement and move base)
             if not rotated_already:
-                # Wait for the device to reach the threshold angle for movement
-                self.wait_until_deadzone(scan_arrival_time)
-
-                # Move the base and start again
-                self.base.move_steps(steps_per_move)
+                if self.continuous:
+                    # Rotate the base by the angle between sweeps during every rotation
+                    self.base.start_continuous_rotation(
+                        steps_per_move / self.scheduler.get_period())
+                else:
+                    # Wait for the device to reach the threshold angle for movement
+                    deadzone_window = self.wait_until_deadzone()
+
+                    # Move the base and start again
+                    pending_move = self.move_base(steps_per_move, deadzone_window)
                 rotated_already = True
                 continue
 
-            # Export the scan
-            self.exporter.export_2D_scan(
-                scan, valid_scan_index, angle_between_sweeps,
-                self.settings.get_mount_angle(), False)
+            # The base angles at the start and end of the sweep (continuous rotation only)
+            base_angles = None
+            if self.continuous:
+                base_angles = self.get_sweep_base_angles(
+                    start_position if not CCW else -start_position)
+
+            # Flag the scan if the base was still moving after the deadzone
+            if move_overran:
+                overrun_sweeps.append(valid_scan_index)
+
+            # Note the ranges missing from the scan, and (when filling gaps) remove the samples
+            # acquired at the wrong base position, to be reacquired once the main pass is done
+            if coverage is not None:
+                excluded_windows = sample_filter.angular_windows.values() + \
+                    (extra_windows or {}).values()
+                coverage.record_sweep(
+                    valid_scan_index, sample_filter.missing_ranges, excluded_windows)
+                if front_misplaced:
+                    coverage.mark_missing(valid_scan_index, -1, 180000, excluded_windows)
+                    if self.fill_gaps:
+                        mask &= scan.angle >= 180000
+                if move_overran:
+                    coverage.mark_missing(valid_scan_index, 179999, 360000, excluded_windows)
+                    if self.fill_gaps:
+                        mask &= scan.angle < 180000
+            front_misplaced = False
+
+            if pipeline is not None:
+                # Hand the scan off to the worker threads
+                pipeline.put((scan, mask, valid_scan_index, base_angles))
+            else:
+                # Remove the rejected readings
+                scan_utils.keep_samples(scan, mask)
+
+                # Export the scan, or buffer it to be transformed after scanning
+                if session is not None:
+                    session.append(scan, valid_scan_index)
+                elif base_angles is not None:
+                    self.exporter.export_continuous_scan(
+                        scan, base_angles[0], base_angles[1],
+                        self.settings.get_mount_angle(), CCW)
+                else:
+                    self.exporter.export_2D_scan(
+                        scan, valid_scan_index, angle_between_sweeps,
+                        self.settings.get_mount_angle(), CCW)
+            if base_angles is not None and session is not None:
+                sweep_base_angles.append(base_angles)
 
             # increment the scan index
             valid_scan_index = valid_scan_index + 1
 
-            # Wait for the device to reach the threshold angle for movement
-            self.wait_until_deadzone(scan_arrival_time)
+            if not self.continuous:
+                # Wait for the device to reach the threshold angle for movement
+                deadzone_window = self.wait_until_deadzone()
 
-            # Move the base and report progress
-            self.base.move_steps(steps_per_move)
-            self.report_scan_progress(num_sweeps, valid_scan_index)
+                # Move the base
+                pending_move = self.move_base(steps_per_move, deadzone_window)
+
+            # Report progress (the pipeline reports progress once a scan is exported)
+            if pipeline is None:
+                self.report_scan_progress(num_sweeps, valid_scan_index)
 
             # Exit after collecting the required number of 2D scans
             if valid_scan_index >= num_sweeps:
                 break
 
-        # Stop scanning and report completion
+        # Finish the last base move
+        if pending_move is not None:
+            self.check_move_overrun(*pending_move)
+        if self.continuous:
+            num_rotation_steps = self.base.stop_continuous_rotation()
+
+        # Wait for the worker threads to finish processing every scan
+        if pipeline is not None:
+            pipeline.close()
+
+        # Revisit the base positions with missing coverage, then stop scanning
+        incomplete_positions = []
+        if coverage is not None:
+            incomplete_positions = coverage.get_incomplete_positions()
+            if self.fill_gaps and incomplete_positions:
+                # the base moved once more after each sweep, and once before the first
+                self.fill_coverage_gaps(scans, coverage, sample_filter, session,
+                                        steps_per_move, angle_between_sweeps, CCW,
+                                        int(num_sweeps) + 1)
         self.device.stop_scanning()
-        self.report_scan_complete()
+
+        stats = {'filter': sample_filter.get_stats(),
+                 'deadzone': self.scheduler.get_stats()}
+        if self.setup_stats is not None:
+            # only the scan following the setup reports it
+            stats['setup'] = self.setup_stats
+            self.setup_stats = None
+        if self.continuous:
+            stats['motion'] = {
+                'steps_per_sec': round(self.base.rotation_steps_per_sec, 3),
+                'rotation_steps': num_rotation_steps,
+                # how far the rotation fell behind its schedule (the base angles of the
+                # samples are interpolated from the steps actually taken)
+                'max_lag_steps': round(self.base.rotation_max_lag, 3)
+            }
+        else:
+            stats['motion'] = self.get_move_stats(steps_per_move)
+            if self.async_moves:
+                stats['motion']['overrun_sweeps'] = overrun_sweeps
+        if coverage is not None:
+            stats['coverage'] = {'incomplete_positions': incomplete_positions}
+            if self.fill_gaps:
+                stats['coverage']['remaining_positions'] = coverage.get_incomplete_positions()
+        if pipeline is not None:
+            stats['pipeline'] = pipeline.get_stats()
+        stats['base'] = self.base.get_motion_stats()
+
+        # Transform and export the entire scan at once
+        if session is not None:
+            output_json_message({
+                'type': "update",
+                'status': "scan",
+                'msg': "Processing scan...",
+                'duration': num_sweeps / self.settings.get_motor_speed(),
+                'remaining': 0
+            })
+            if self.continuous:
+                self.exporter.export_continuous_session(
+                    session, sweep_base_angles, self.settings.get_mount_angle(), CCW)
+            else:
+                self.exporter.export_session(
+                    session, angle_between_sweeps, self.settings.get_mount_angle(), CCW)
+
+        # Wait for the pending writes, so the exported file is complete once reported
+        self.exporter.flush()
+        stats['export'] = self.exporter.get_stats()
+
+        # Report completion
+        self.report_scan_complete(stats)
+
+    def move_base(self, num_steps, deadzone_window):
+        """Moves the base. For async moves, returns the MoveFuture of the move dispatched
+        to the motion thread and the deadzone window it must fit in, otherwise returns None.
+        :param num_steps: the number of steps to move
+        :param deadzone_window: the times the sensor enters and leaves the deadzone
+        """
+        if not self.async_moves:
+            self.scheduler.record_move_start(deadzone_window[0])
+            self.base.move_steps(num_steps)
+            return None
+
+        return self.base.move_steps_async(num_steps), deadzone_window
+
+    def get_move_stats(self, num_steps):
+        """Returns the step rate measured while moving the base, and how long a move takes
+        compared to the time spent in the deadzone
+        :param num_steps: the # of steps per move
+        """
+        step_rate = self.base.get_step_rate()
+        if step_rate is None:
+            return {}
+        enter_time, leave_time = self.scheduler.get_deadzone_window()
+        return {
+            'step_rate': round(step_rate, 1),
+            'move_ms': round(1000.0 * abs(num_steps) / step_rate, 3),
+            'deadzone_ms': round(1000.0 * (leave_time - enter_time), 3)
+        }
+
+    def check_move_overrun(self, move, deadzone_window):
+        """Waits for a dispatched base move to finish, and records when it started.
+        Returns true if it finished after the sensor left the deadzone.
+        :param move: the MoveFuture of the move
+        :param deadzone_window: the times the sensor enters and leaves the deadzone
+        """
+        move.wait()
+        self.scheduler.record_move_start(deadzone_window[0], move.start_time)
+        return move.end_time > deadzone_window[1]
+
+    def fill_coverage_gaps(self, scans, coverage, sample_filter, session, steps_per_move,
+                           angle_between_sweeps, CCW, position, max_attempts=None):
+        """Revisits the base positions with missing coverage. A sweep is acquired at each one
+        with the base stationary, and only its samples in the missing ranges are exported.
+        The base is then returned to where it was, so a follow-up scan can start from there.
+        :param scans: the generator of scans from the device
+        :param coverage: the CoverageTracker of the scan
+        :param sample_filter: the ScanFilter of the scan
+        :param session: optional ScanSession buffering the scans for a deferred transform
+        :param steps_per_move: the number of steps between base positions
+        :param angle_between_sweeps: the angle the base moves between sweeps
+        :param CCW: True if base rotates CCW during scan
+        :param position: the current base position index
+        :param max_attempts: max # of sweeps acquired at each position, defaults to 3
+        """
+        if max_attempts is None:
+            max_attempts = 3
+
+        end_position = position
+        positions = coverage.get_incomplete_positions()
+        duration = 2.0 * len(positions) / self.settings.get_motor_speed()
+        # the base is past the last position, so revisit them in reverse to minimize travel
+        for count, target in enumerate(reversed(positions)):
+            output_json_message({
+                'type': "update",
+                'status': "scan",
+                'msg': "Filling coverage gaps...",
+                'duration': duration,
+                'remaining': duration * (len(positions) - count) / len(positions)
+            })
+
+            self.base.move_planned((target - position) * steps_per_move)
+            position = target
+            move_end_time = monotonic()
+
+            # wait for a sweep acquired entirely after the move
+            for _ in range(max_attempts):
+                scan = self.wait_for_stationary_sweep(scans, move_end_time)
+                mask = sample_filter.evaluate(scan)
+                if mask is not None:
+                    break
+            else:
+                continue
+
+            mask &= coverage.get_missing_mask(position, scan.angle)
+            coverage.record_refill(position, sample_filter.missing_ranges)
+
+            # the samples before the 180 degree mark of the sweep at index n are exported at
+            # base position n, and those after the mark at base position n + 1
+            before_mark = scan.angle < 180000
+            for scan_index, half in [(position, before_mark), (position - 1, ~before_mark)]:
+                half_mask = mask & half
+                if scan_index < 0 or not np.any(half_mask):
+                    continue
+                part = scan.copy()
+                part.keep(half_mask)
+                if session is not None:
+                    session.append(part, scan_index)
+                else:
+                    self.exporter.export_2D_scan(
+                        part, scan_index, angle_between_sweeps,
+                        self.settings.get_mount_angle(), CCW)
+
+        self.base.move_planned((end_position - position) * steps_per_move)
+
+    def wait_for_stationary_sweep(self, scans, move_end_time):
+        """Returns the first scan acquired entirely after the base stopped moving
+        :param scans: the generator of scans from the device
+        :param move_end_time: the time the base stopped moving (monotonic clock)
+        """
+        for scan in scans:
+            self.scheduler.record_arrival()
+            # the sweep was acquired during the rotation which ended as it arrived
+            sweep_start_time = self.scheduler.get_zero_crossing() - self.scheduler.get_period()
+            if sweep_start_time >= move_end_time:
+                return scan_utils.as_columnar(scan)
+
+    def get_sweep_base_angles(self, start_offset=None):
+        """Returns the base angles (in degrees, in the direction of the continuous rotation)
+        when the sweep which just arrived crossed 0 and 360 deg
+        :param start_offset: the position (in steps, in the direction of the rotation) where
+                             the continuous rotation started, defaults to 0
+        """
+        if start_offset is None:
+            start_offset = 0
+
+        # the sweep was acquired during the rotation which ended as it arrived
+        sweep_end_time = self.scheduler.get_zero_crossing()
+        sweep_start_time = sweep_end_time - self.scheduler.get_period()
+        steps_per_deg = self.base.get_steps_per_deg()
+        return ((start_offset + self.base.get_rotation_steps(sweep_start_time)) / steps_per_deg,
+                (start_offset + self.base.get_rotation_steps(sweep_end_time)) / steps_per_deg)
+
+    def create_pipeline(self, num_sweeps, angle_between_sweeps, CCW, session=None):
+        """Creates a pipeline of worker threads which remove rejected samples, then
+        transform and export each scan (or buffer it, if a session is provided).
+        Items put in the pipeline are (scan, keep mask, scan index, base angles) tuples,
+        where base angles are the sweep's start and end base angles (continuous rotation),
+        or None.
+        :param num_sweeps: the number of sweeps in the scan
+        :param angle_between_sweeps: the angle the base moves between sweeps
+        :param CCW: True if base rotates CCW during scan
+        :param session: optional ScanSession buffering the scans for a deferred transform
+        """
+        mount_angle = self.settings.get_mount_angle()
+
+        def filter_scan(item):
+            """Removes the rejected samples from the scan"""
+            scan, mask, scan_index, base_angles = item
+            scan_utils.keep_samples(scan, mask)
+            return scan, scan_index, base_angles
+
+        def transform_scan(item):
+            """Converts the scan to 3D cartesian coordinates"""
+            scan, scan_index, base_angles = item
+            if base_angles is not None:
+                converted_coords = self.exporter.transform_continuous_scan(
+                    scan, base_angles[0], base_angles[1], mount_angle, CCW)
+            else:
+                converted_coords = self.exporter.transform_2D_scan(
+                    scan, scan_index, angle_between_sweeps, mount_angle, CCW)
+            return converted_coords, scan.signal_strength, scan_index
+
+        def export_scan(item):
+            """Writes the converted coordinates to the file and reports progress"""
+            converted_coords, signal_strength, scan_index = item
+            self.exporter.export_points(converted_coords, signal_strength)
+            self.report_scan_progress(num_sweeps, scan_index + 1)
+
+        def buffer_scan(item):
+            """Appends the scan to the session buffer and reports progress"""
+            scan, scan_index, _ = item
+            session.append(scan, scan_index)
+            self.report_scan_progress(num_sweeps, scan_index + 1)
+
+        if session is not None:
+            stages = [('filter', filter_scan), ('buffer', buffer_scan)]
+        else:
+            stages = [('filter', filter_scan), ('transform', transform_scan),
+                      ('export', export_scan)]
+
+        return scan_pipeline.ScanPipeline(stages)
 
     def idle(self):
         """Stops the device from spinning"""
@@ -205,14 +672,12 @@ class Scanner(object):
             # Currently the workaround is that the node app will kill this
             # process if it receives an error
 
-    def wait_until_deadzone(self, t_0):
-        """ Waits the however long is required to reach the deadzone
-        :param t_0: The time the sweep crossed the 0 degree mark
+    def wait_until_deadzone(self):
+        """ Waits the however long is required to reach the deadzone, as estimated from
+        the arrival times of the previous sweeps.
+        Returns the times the sensor enters and leaves the deadzone.
         """
-        time_until_deadzone = self.settings.get_time_to_deadzone_sec() - \
-            (time.time() - t_0)
-        if time_until_deadzone > 0:
-            time.sleep(time_until_deadzone)
+        return self.scheduler.wait_until_deadzone()
 
     def report_scan_initiated(self, num_sweeps):
         """ Reports that a scan has been initiated """
@@ -234,21 +699,35 @@ class Scanner(object):
             'remaining': (num_sweeps - valid_scan_index) / self.settings.get_motor_speed()
         })
 
-    def report_scan_complete(self):
-        """ Reports the completion of a scan """
-        output_json_message({
+    def report_scan_complete(self, stats=None):
+        """ Reports the completion of a scan
+        :param stats: optional dict of statistics gathered during the scan
+        """
+        message = {
             'type': "update",
             'status': "complete",
             'msg': "Finished scan!"
-        })
+        }
+        if stats is not None:
+            message['stats'] = stats
+        output_json_message(message)
 
     def shutdown(self):
         """Print message and shutdown"""
         exit()
 
 
+def get_follow_up_file_name(file_name, scan_number):
+    """Returns the file name for a follow-up scan (ie: "Scan.csv" -> "Scan (2).csv")
+    :param file_name: the file name of the first scan
+    :param scan_number: the index of the follow-up scan (the first scan is 0)
+    """
+    root, extension = os.path.splitext(file_name)
+    return "{} ({}){}".format(root, scan_number + 1, extension)
+
+
 def main(arg_dict):
-    """Creates a 3D scanner and gather a scan"""
+    """Creates a 3D scanner and gather one or more scans"""
     # Create a scan settings obj
     settings = scan_settings.ScanSettings(
         int(arg_dict['motor_speed']),   # desired motor speed setting
@@ -259,8 +738,24 @@ def main(arg_dict):
         int(arg_dict['mount_angle'])
     )
 
+    # Trig lookup table shared by the exporters (built once)
+    trig_table = None
+    if arg_dict['trig_table']:
+        trig_table = scan_utils.TrigTable()
+
+    def create_exporter(file_name):
+        """Returns an exporter writing to the file with the requested policy"""
+        exporter = scan_exporter.ScanExporter(
+            file_name=file_name,
+            async_writes=arg_dict['async_writes'],
+            flush_policy=arg_dict['flush'],
+            flush_size=int(float(arg_dict['flush_mb']) * 1024 * 1024),
+            fsync=arg_dict['fsync'])
+        exporter.set_trig_table(trig_table)
+        return exporter
+
     # Create an exporter
-    exporter = scan_exporter.ScanExporter(file_name=arg_dict['output'])
+    exporter = create_exporter(arg_dict['output'])
 
     use_dummy = arg_dict['use_dummy']
 
@@ -274,20 +769,56 @@ def main(arg_dict):
                 {'type': "update", 'status': "failed", 'msg': "Failed to connect to sweep device... make sure it is plugged in."})
             time.sleep(0.1)
             return
-        # Create a scanner object
-        time.sleep(1.0)
-        scanner = Scanner(
-            device=sweep, base=base, settings=settings, exporter=exporter)
-
-        # Setup the scanner
-        scanner.setup()
 
-        # Perform the scan
-        scanner.perform_scan()
-
-        # Stop the scanner
-        time.sleep(1.0)
-        scanner.idle()
+        # Restore the base position if the last run shut down cleanly (only once the device
+        # is connected, so a failed connection leaves the persisted state untouched)
+        base.load_state()
+
+        try:
+            # Create a scanner object
+            time.sleep(1.0)
+            scanner = Scanner(
+                device=sweep, base=base, settings=settings, exporter=exporter,
+                deferred_transform=arg_dict['deferred_transform'],
+                pipelined=arg_dict['pipelined'],
+                async_moves=arg_dict['async_moves'],
+                continuous=arg_dict['continuous'],
+                fill_gaps=arg_dict['fill_gaps'],
+                latency=float(arg_dict['latency']) / 1000.0)
+
+            # Setup the scanner
+            scanner.setup()
+
+            CCW = False
+            for scan_number in range(int(arg_dict['num_scans'])):
+                # Follow-up scans are exported to their own file
+                if scan_number > 0:
+                    scanner.exporter = create_exporter(
+                        get_follow_up_file_name(arg_dict['output'], scan_number))
+                    if arg_dict['bidirectional']:
+                        # Scan back from where the previous scan ended, without homing the base
+                        CCW = not CCW
+                    else:
+                        scanner.setup_base()
+
+                # Perform the scan (closing the file even if it fails, so no write is lost)
+                try:
+                    scanner.perform_scan(CCW)
+                finally:
+                    scanner.exporter.close()
+
+            # Stop the scanner
+            time.sleep(1.0)
+            scanner.idle()
+        except SystemExit as error:
+            # a clean early exit keeps the base position for the next run, while any error
+            # leaves the state consumed, so the next run homes the base
+            if not error.code:
+                base.save_state()
+            raise
+
+        # Persist the base position, so the next run can skip homing
+        base.save_state()
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
@@ -318,6 +849,71 @@ if __name__ == '__main__':
                         help='Filepath for the exported scan',
                         default=default_filename,
                         required=False)
+    parser.add_argument('--deferred_transform',
+                        help='Transform the scan after acquisition, instead of during',
+                        default=False,
+                        action='store_true',
+                        required=False)
+    parser.add_argument('--pipelined',
+                        help='Process sweeps on worker threads, off the acquisition thread',
+                        default=False,
+                        action='store_true',
+                        required=False)
+    parser.add_argument('--async_moves',
+                        help='Move the base on a separate thread, while acquiring the next sweep',
+                        default=False,
+                        action='store_true',
+                        required=False)
+    parser.add_argument('--continuous',
+                        help='Rotate the base continuously, instead of moving it between sweeps',
+                        default=False,
+                        action='store_true',
+                        required=False)
+    parser.add_argument('--fill_gaps',
+                        help='Revisit base positions with missing coverage after the scan',
+                        default=False,
+                        action='store_true',
+                        required=False)
+    parser.add_argument('--latency',
+                        help='Delay (in ms) between the sensor crossing 0 deg and a sweep '
+                        'arriving, subtracted from the scheduled base moves',
+                        default=0,
+                        required=False)
+    parser.add_argument('-n', '--num_scans',
+                        help='Number of consecutive scans to perform',
+                        default=1,
+                        required=False)
+    parser.add_argument('--bidirectional',
+                        help='Perform consecutive scans back and forth, without homing the base',
+                        default=False,
+                        action='store_true',
+                        required=False)
+    parser.add_argument('--trig_table',
+                        help='Convert samples to cartesian coordinates with a 1/16 degree trig '
+                        'lookup table, instead of computing cos/sin for every sample',
+                        default=False,
+                        action='store_true',
+                        required=False)
+    parser.add_argument('--async_writes',
+                        help='Write the exported file on a writer thread, off the acquisition thread',
+                        default=False,
+                        action='store_true',
+                        required=False)
+    parser.add_argument('--flush',
+                        help='When to flush the exported file: after every sweep, '
+                        'every --flush_mb MB, or at the end of the scan',
+                        choices=scan_writer.ScanWriter.flush_policies,
+                        default='end',
+                        required=False)
+    parser.add_argument('--flush_mb',
+                        help='MB written between flushes of the exported file (with --flush size)',
+                        default=1,
+                        required=False)
+    parser.add_argument('--fsync',
+                        help='Force the exported file to disk on every flush',
+                        default=False,
+                        action='store_true',
+                        required=False)
     parser.add_argument('-d', '--use_dummy',
                         help='Use the dummy verison without hardware',
                         default=False,
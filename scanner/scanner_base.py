@@ -1,16 +1,160 @@
 """Defines the rotating base of the scanner"""
+import os
 import time
+import bisect
+import json
 import atexit
 import itertools
 import argparse
+import threading
+import functools
+import contextlib
+import collections
+import Queue
+import numpy as np
 from scanner_output import output_json_message
+from monotonic_clock import monotonic
+
+
+class MoveFuture(object):
+    """The pending completion of a base move dispatched to the motion thread.
+    Attributes:
+        num_steps: the number of steps to move
+        start_time: the time the move started on the monotonic clock (None until started)
+        end_time: the time the move finished on the monotonic clock (None until finished)
+        error: the exception raised by the move, if any
+    """
+
+    def __init__(self, num_steps):
+        """Return a MoveFuture object
+        :param num_steps: the number of steps to move
+        """
+        self.num_steps = num_steps
+        self.start_time = None
+        self.end_time = None
+        self.error = None
+        self.finished = threading.Event()
+
+    def done(self):
+        """Returns true if the move has finished"""
+        return self.finished.is_set()
+
+    def wait(self, timeout=None):
+        """Waits for the move to finish. Returns true if it finished.
+        Raises any error encountered while moving.
+        :param timeout: max time to wait in seconds, defaults to waiting indefinitely
+        """
+        finished = self.finished.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        return finished
+
+    def get_duration(self):
+        """Returns the duration of the move in seconds (None until finished)"""
+        if self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
+
+class _PWMRecorder(object):
+    """Stands in for the motor hat controller of a stepper, recording the PWM writes of a
+    step instead of sending them over I2C"""
+
+    def __init__(self, Adafruit_MotorHAT):
+        """Return a _PWMRecorder object
+        :param Adafruit_MotorHAT: the motor hat class, whose setPin is reused
+        """
+        self.Adafruit_MotorHAT = Adafruit_MotorHAT
+        self._pwm = self
+        self.writes = []
+
+    def setPWM(self, channel, on, off):
+        """Records a PWM write"""
+        self.writes.append((channel, on, off))
+
+    def setPin(self, pin, value):
+        """Records the PWM write of a pin, as done by the motor hat"""
+        self.Adafruit_MotorHAT.setPin.__func__(self, pin, value)
+
+
+class _PWMCounter(object):
+    """Wraps the PWM driver of the motor hat, counting the calls made to it
+    (each writes the registers of a PWM channel over the I2C bus)"""
+
+    def __init__(self, pwm):
+        """Return a _PWMCounter object
+        :param pwm: the PWM driver of the motor hat
+        """
+        self.pwm = pwm
+        self.num_calls = 0
+
+    def setPWM(self, channel, on, off):
+        """Counts and forwards a PWM write"""
+        self.num_calls = self.num_calls + 1
+        self.pwm.setPWM(channel, on, off)
+
+    def __getattr__(self, name):
+        return getattr(self.pwm, name)
+
+
+def instrumented(operation):
+    """Decorates a ScannerBase method, recording the motion it performs
+    :param operation: the name the motion is recorded under
+    """
+    def decorator(method):
+        """Returns the instrumented method"""
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            """Calls the method within the instrumentation of the operation"""
+            with self.instrument(operation):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
 
 class ScannerBase(object):
     """The base of the 3d scanner (controls rotation via stepper motor).
     Attributes:
         motor_hat: default adafruit motor hat object
         stepper: the stepper motor
+        position: the # of steps the base moved (in the direction of positive moves) since home
+        position_confident: true if the position is known (ie: after homing, or restoring the
+                            state persisted by a clean shutdown)
+        motion_queue: moves waiting for the motion thread
+        motion_thread: the thread executing dispatched moves (None until first used)
+        rotation_thread: the thread stepping the base during continuous rotation
+        rotation_stop: set to stop the continuous rotation
+        rotation_steps_per_sec: the step rate of the continuous rotation
+        rotation_start_time: the time the continuous rotation started (monotonic clock)
+        rotation_num_steps: the number of steps taken during the continuous rotation
+        rotation_log: the (time, # of steps taken) after each step of the continuous rotation
+        rotation_max_lag: the most steps the continuous rotation fell behind its schedule
+        microsteps_per_step: the # of micro-steps per full step of the stepper
+        transit_style: the step style of long moves
+        phase_tables: the PWM writes setting the coils to each phase reached by a step of each
+                      style (the table of a style is None if it does not support step trains)
+        channel_state: the last (on, off) values written to each PWM channel by a step train
+        train_stats: the # of steps and duration of the step trains moved at full speed
+        bus: counts the calls to the PWM driver of the motor hat (None if it has none)
+        num_steps_moved: the total # of micro-steps moved in any direction
+        motion_records: the most recent motion operations, with their wall time, # of steps,
+                        achieved step rate and # of bus calls
+        motion_stats: the totals of the motion operations since the last reset, by operation
+                      name
     """
+    # File persisting the position of the base between runs
+    state_file = os.path.join(os.path.dirname(
+        os.path.abspath(__file__)), '../base_state.json')
+    # Number of micro-steps per full step, unless defined by the stepper
+    microsteps_per_step = 8
+    # Min # of micro-steps of a planned move for it to use the coarser transit step style
+    min_transit_steps = 64
+    # Limits of planned moves: the rate the motor can start at without ramping, the max
+    # cruising rate (micro-steps/sec) and the acceleration (micro-steps/sec^2), for the nominal
+    # load. They apply to the motion of the base, whatever the step style.
+    start_step_rate = 400
+    max_step_rate = 3200
+    acceleration = 6400
 
     def __init__(self, stepper_steps_per_rev=None, stepper_motor_port=None, switch=None, use_dummy=False):
         """Return a ScannerBase object
@@ -38,28 +182,557 @@ class ScannerBase(object):
         self.motor_hat = self.Adafruit_MotorHAT()
         self.stepper = self.motor_hat.getStepper(
             stepper_steps_per_rev, stepper_motor_port)
-        # default to 1 RPM (only used during reset)
-        self.stepper.setSpeed(1)
-
+        self.stepper_steps_per_rev = stepper_steps_per_rev
+        # count the bus transactions made through the motor hat
+        self.bus = None
+        if hasattr(self.motor_hat, '_pwm'):
+            self.bus = _PWMCounter(self.motor_hat._pwm)
+            self.motor_hat._pwm = self.bus
+        self.microsteps_per_step = getattr(
+            self.stepper, 'MICROSTEPS', self.microsteps_per_step)
         # note the limit switch
         self.switch = switch
 
+        # the position of the base (in steps) relative to home, unknown until homed or restored
+        self.position = 0
+        self.position_confident = False
+
+        # moves dispatched to the motion thread
+        self.motion_queue = Queue.Queue()
+        self.motion_thread = None
+
+        # continuous rotation
+        self.rotation_thread = None
+        self.rotation_stop = threading.Event()
+        self.rotation_steps_per_sec = 0.0
+        self.rotation_start_time = None
+        self.rotation_num_steps = 0
+        self.rotation_log = []
+        self.rotation_max_lag = 0.0
+
+        # step trains, using full steps (both coils on, for more torque) for long moves
+        self.transit_style = self.Adafruit_MotorHAT.DOUBLE
+        self.phase_tables = self.build_phase_tables()
+        self.channel_state = {}
+        self.train_stats = {'steps': 0, 'duration': 0.0}
+
+        # motion instrumentation
+        self.num_steps_moved = 0
+        self.motion_records = collections.deque(maxlen=1000)
+        self.motion_stats = {}
+        self.instrumentation = threading.local()
+        self.rotation_bus_calls = 0
+
         atexit.register(self.turn_off_motors)
 
+    @instrumented('move_steps')
     def move_steps(self, num_steps=None):
         """Moves the stepper motor the specified number of steps
         :param num_steps: # of steps to move, defaults to 1
         """
         if num_steps is None:
             num_steps = 1
+        self.move_step_train(num_steps)
+
+    def move_step_train(self, num_steps, step_times=None, stop_event=None, style=None):
+        """Moves the stepper motor the specified number of steps in a tight sequence.
+        The coil updates of every step are precomputed, and only the PWM channels which
+        change from one step to the next are written.
+        Returns the achieved rate in micro-steps/sec.
+        :param num_steps: # of micro-steps to move (negative values move the other way)
+        :param step_times: optional sequence of the time of each step, in seconds relative to
+                           the start of the train, defaults to moving as fast as possible
+        :param stop_event: optional threading.Event, checked before every step, which stops
+                           the train early once set (ie: by the limit switch callback)
+        :param style: the step style, defaults to MICROSTEP. With coarser styles, the train must
+                      start on a step of the style (see get_step_lead), and num_steps must be a
+                      multiple of the step size.
+        """
+        if style is None:
+            style = self.Adafruit_MotorHAT.MICROSTEP
         if num_steps < 0:
-            num_steps = abs(num_steps)
             direction = self.Adafruit_MotorHAT.FORWARD
         else:
             direction = self.Adafruit_MotorHAT.BACKWARD
+        if num_steps == 0:
+            return 0.0
+        step_size = self.get_step_size(style)
+        if num_steps % step_size != 0 or self.get_step_lead(style, num_steps) != 0:
+            raise ValueError("Step train is not aligned to steps of its style")
+        # the change in position of each step
+        position_step = step_size if direction == self.Adafruit_MotorHAT.BACKWARD else -step_size
+        num_steps = abs(num_steps) // step_size
+
+        start_position = self.position
+        start_time = monotonic()
+        try:
+            if self.phase_tables.get(style) is None:
+                # the library writes the coils itself, so the cached channel values are stale
+                self.channel_state.clear()
+                for n in xrange(num_steps):
+                    self._wait_for_step(start_time, step_times, n)
+                    if stop_event is not None and stop_event.is_set():
+                        break
+                    self.stepper.oneStep(direction, style)
+                    self.position = self.position + position_step
+            else:
+                self._move_phases(num_steps, position_step, self.phase_tables[style],
+                                  start_time, step_times, stop_event)
+        except Exception:
+            # a step may or may not have happened
+            self.lose_position()
+            raise
+        duration = monotonic() - start_time
+        num_steps = abs(self.position - start_position)
+        self.num_steps_moved = self.num_steps_moved + num_steps
+
+        # measure the rate achieved at full speed
+        if step_times is None and stop_event is None and step_size == 1:
+            self.train_stats['steps'] = self.train_stats['steps'] + num_steps
+            self.train_stats['duration'] = self.train_stats['duration'] + duration
+        if duration <= 0:
+            return float('inf')
+        return num_steps / duration
+
+    def _move_phases(self, num_steps, position_step, phase_table, start_time, step_times,
+                     stop_event):
+        """Writes the precomputed coil updates of each step of a train
+        :param num_steps: # of steps to move
+        :param position_step: the change in position (in micro-steps) of each step
+        :param phase_table: the PWM writes setting the coils to each phase
+        :param start_time: the start time of the train (monotonic clock)
+        :param step_times: optional sequence of the time of each step
+        :param stop_event: optional threading.Event stopping the train once set
+        """
+        set_pwm = self.motor_hat._pwm.setPWM
+        num_phases = len(phase_table)
+        channel_state = self.channel_state
+        # moving in the direction of positive moves steps the driver backward
+        phase = self.stepper.currentstep
+        for n in xrange(num_steps):
+            phase = (phase - position_step) % num_phases
+            self._wait_for_step(start_time, step_times, n)
+            if stop_event is not None and stop_event.is_set():
+                break
+            for channel, on, off in phase_table[phase]:
+                if channel_state.get(channel) != (on, off):
+                    set_pwm(channel, on, off)
+                    channel_state[channel] = (on, off)
+            self.stepper.currentstep = phase
+            self.position = self.position + position_step
+
+    @staticmethod
+    def _wait_for_step(start_time, step_times, n):
+        """Sleeps until the time of a step
+        :param start_time: the start time of the train (monotonic clock)
+        :param step_times: sequence of the time of each step, or None to not wait
+        :param n: the index of the step
+        """
+        if step_times is None:
+            return
+        delay = start_time + step_times[n] - monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def get_step_size(self, style):
+        """Returns the # of micro-steps moved by a step of the specified style
+        :param style: the step style (MICROSTEP, INTERLEAVE or DOUBLE)
+        """
+        if style == self.Adafruit_MotorHAT.MICROSTEP:
+            return 1
+        if style == self.Adafruit_MotorHAT.INTERLEAVE:
+            return self.microsteps_per_step // 2
+        if style == self.Adafruit_MotorHAT.DOUBLE:
+            return self.microsteps_per_step
+        raise ValueError("Unsupported step style")
+
+    def get_step_offset(self, style):
+        """Returns the phase (in micro-steps) of the steps of the specified style, relative
+        to a multiple of the step size
+        :param style: the step style (MICROSTEP, INTERLEAVE or DOUBLE)
+        """
+        # both coils are equally on (DOUBLE) half way between two full steps (SINGLE)
+        if style == self.Adafruit_MotorHAT.DOUBLE:
+            return self.microsteps_per_step // 2
+        return 0
+
+    def get_step_lead(self, style, num_steps):
+        """Returns the # of micro-steps (in the direction of a move) to the nearest step of
+        the specified style
+        :param style: the step style
+        :param num_steps: the # of steps of the move (only its sign is used)
+        """
+        direction = 1 if num_steps >= 0 else -1
+        # moving in the direction of positive moves steps the driver backward
+        return (direction * (self.get_phase() - self.get_step_offset(style))) % \
+            self.get_step_size(style)
+
+    def build_phase_tables(self):
+        """Returns the PWM writes setting the coils to each phase reached by a step of each
+        style, as recorded from the motor hat library. The table of a style is None if the
+        stepper does not support step trains."""
+        styles = [self.Adafruit_MotorHAT.MICROSTEP, self.Adafruit_MotorHAT.INTERLEAVE,
+                  self.Adafruit_MotorHAT.DOUBLE]
+        stepper = self.stepper
+        if not (hasattr(stepper, 'MC') and hasattr(stepper, 'currentstep')):
+            return dict((style, None) for style in styles)
+
+        num_phases = self.microsteps_per_step * 4
+        recorder = _PWMRecorder(self.Adafruit_MotorHAT)
+        controller, current_step = stepper.MC, stepper.currentstep
+        stepper.MC = recorder
+        phase_tables = {}
+        try:
+            for style in styles:
+                step_size = self.get_step_size(style)
+                phase_table = [None] * num_phases
+                for phase in range(self.get_step_offset(style), num_phases, step_size):
+                    stepper.currentstep = (phase - step_size) % num_phases
+                    recorder.writes = []
+                    stepper.oneStep(self.Adafruit_MotorHAT.FORWARD, style)
+                    if stepper.currentstep != phase:
+                        # the steps of the library do not land where expected
+                        phase_table = None
+                        break
+                    phase_table[phase] = tuple(recorder.writes)
+                phase_tables[style] = phase_table
+        finally:
+            stepper.MC, stepper.currentstep = controller, current_step
+        return phase_tables
+
+    def choose_step_style(self, num_steps):
+        """Returns the step style of a planned move: coarse steps for long (transit) moves,
+        micro-steps otherwise
+        :param num_steps: # of micro-steps to move
+        """
+        if abs(num_steps) >= self.min_transit_steps:
+            return self.transit_style
+        return self.Adafruit_MotorHAT.MICROSTEP
+
+    def plan_move(self, num_steps, load=None, style=None, max_rate=None):
+        """Returns the time of each step of a move with a trapezoidal velocity profile
+        (accelerate, cruise, decelerate), within the motion limits of the base
+        :param num_steps: # of micro-steps to move
+        :param load: the inertia of the load relative to the nominal load, which scales down
+                     the acceleration, defaults to 1
+        :param style: the step style, defaults to MICROSTEP
+        :param max_rate: the max rate in micro-steps/sec, defaults to max_step_rate
+        """
+        if load is None:
+            load = 1.0
+        if style is None:
+            style = self.Adafruit_MotorHAT.MICROSTEP
+        if max_rate is None:
+            max_rate = self.max_step_rate
+        # the limits apply to the motion of the base, so are scaled to the step size
+        step_size = float(self.get_step_size(style))
+        return get_trapezoidal_step_times(
+            abs(num_steps) // int(step_size), self.start_step_rate / step_size,
+            max_rate / step_size, self.acceleration / load / step_size)
+
+    @instrumented('move_planned')
+    def move_planned(self, num_steps, load=None, style=None, max_rate=None, stop_event=None):
+        """Moves the stepper motor the specified number of steps, following a trapezoidal
+        velocity profile. Use for large moves, which can then run near the limits of the motor.
+        Long moves use coarse steps: the base micro-steps to the nearest coarse step, moves
+        in coarse steps, then micro-steps the remainder.
+        Returns the achieved rate in micro-steps/sec.
+        :param num_steps: # of micro-steps to move (negative values move the other way)
+        :param load: the inertia of the load relative to the nominal load, defaults to 1
+        :param style: the step style, defaults to the one chosen for the length of the move
+        :param max_rate: the max rate in micro-steps/sec, defaults to max_step_rate
+        :param stop_event: optional threading.Event stopping the move once set
+        """
+        if style is None:
+            style = self.choose_step_style(num_steps)
+        microstep = self.Adafruit_MotorHAT.MICROSTEP
+        direction = 1 if num_steps >= 0 else -1
+        num_steps = abs(num_steps)
+
+        step_size = self.get_step_size(style)
+        lead = self.get_step_lead(style, direction)
+        if num_steps < lead + step_size:
+            segments = [(num_steps, microstep)]
+        else:
+            coarse_steps = (num_steps - lead) // step_size * step_size
+            segments = [(lead, microstep), (coarse_steps, style),
+                        (num_steps - lead - coarse_steps, microstep)]
+
+        start_position = self.position
+        start_time = monotonic()
+        for segment_steps, segment_style in segments:
+            if stop_event is not None and stop_event.is_set():
+                break
+            if segment_steps == 0:
+                continue
+            self.move_step_train(
+                direction * segment_steps,
+                self.plan_move(segment_steps, load, segment_style, max_rate),
+                stop_event, segment_style)
+        duration = monotonic() - start_time
+        if duration <= 0:
+            return float('inf')
+        return abs(self.position - start_position) / duration
+
+    @contextlib.contextmanager
+    def instrument(self, operation):
+        """Records the wall time, # of steps, achieved step rate and # of bus calls of a motion
+        operation. Operations nested in another one are only accounted for in the outer one.
+        :param operation: the name of the operation
+        """
+        depth = getattr(self.instrumentation, 'depth', 0)
+        self.instrumentation.depth = depth + 1
+        start_steps = self.num_steps_moved
+        start_bus_calls = self.get_bus_calls()
+        start_time = monotonic()
+        try:
+            yield
+        finally:
+            self.instrumentation.depth = depth
+            if depth == 0:
+                self.record_motion(operation, self.num_steps_moved - start_steps,
+                                   monotonic() - start_time,
+                                   self.get_bus_calls() - start_bus_calls)
+
+    def record_motion(self, operation, num_steps, duration, bus_calls):
+        """Records a motion operation
+        :param operation: the name of the operation
+        :param num_steps: the # of micro-steps moved
+        :param duration: the wall time of the operation in seconds
+        :param bus_calls: the # of calls to the PWM driver of the motor hat
+        """
+        self.motion_records.append({
+            'operation': operation,
+            'steps': num_steps,
+            'duration': duration,
+            'step_rate': num_steps / duration if duration > 0 else None,
+            'bus_calls': bus_calls
+        })
+        stats = self.motion_stats.setdefault(
+            operation, {'count': 0, 'steps': 0, 'duration': 0.0, 'max_duration': 0.0,
+                        'bus_calls': 0})
+        stats['count'] = stats['count'] + 1
+        stats['steps'] = stats['steps'] + num_steps
+        stats['duration'] = stats['duration'] + duration
+        stats['max_duration'] = max(stats['max_duration'], duration)
+        stats['bus_calls'] = stats['bus_calls'] + bus_calls
+
+    def reset_motion_stats(self):
+        """Resets the totals of the motion operations (ie: at the start of every scan)"""
+        self.motion_stats = {}
+
+    def get_motion_stats(self):
+        """Returns the totals of the motion operations, by operation name"""
+        motion_stats = {}
+        for operation, stats in self.motion_stats.items():
+            motion_stats[operation] = {
+                'count': stats['count'],
+                'steps': stats['steps'],
+                'mean_ms': round(1000.0 * stats['duration'] / stats['count'], 3),
+                'max_ms': round(1000.0 * stats['max_duration'], 3),
+                'step_rate': (round(stats['steps'] / stats['duration'], 1)
+                              if stats['duration'] > 0 else None),
+                'bus_calls': stats['bus_calls'],
+                'bus_calls_per_step': (round(1.0 * stats['bus_calls'] / stats['steps'], 2)
+                                       if stats['steps'] > 0 else None)
+            }
+        return motion_stats
+
+    def get_bus_calls(self):
+        """Returns the total # of calls to the PWM driver of the motor hat"""
+        if self.bus is None:
+            return 0
+        return self.bus.num_calls
+
+    def get_step_rate(self):
+        """Returns the rate (in steps/sec) achieved by the step trains moved at full speed,
+        or None if none have been moved yet"""
+        if self.train_stats['duration'] <= 0:
+            return None
+        return self.train_stats['steps'] / self.train_stats['duration']
+
+    def get_position(self):
+        """Returns the position of the base (in steps) relative to the home position"""
+        return self.position
+
+    def lose_position(self):
+        """Notes that the position of the base can no longer be trusted (ie: the base was
+        moved by hand or a move failed), so that it must be homed before the next scan"""
+        self.position_confident = False
+
+    def move_to_angle(self, angle):
+        """Moves the base to an absolute angle, as close as step resolution permits.
+        Raises a ValueError if the position of the base is unknown.
+        :param angle: angle relative to the home position in degrees
+                      (in the direction of move_steps with positive # of steps)
+        """
+        if not self.position_confident:
+            raise ValueError("Base position is unknown... reset the base first")
+        target = int(round(angle * self.get_steps_per_deg()))
+        self.move_planned(target - self.position)
+
+    def get_phase(self):
+        """Returns the micro-step phase of the stepper driver's coil currents"""
+        # moving in the direction of positive moves steps the driver backward
+        return getattr(self.stepper, 'currentstep', -self.position)
+
+    def align_to_full_step(self):
+        """Moves the base to the nearest full step, where it stays put when the motor is
+        released (between full steps, the rotor snaps to one when the coils are turned off)
+        """
+        offset = self.get_phase() % self.microsteps_per_step
+        if offset <= self.microsteps_per_step / 2:
+            self.move_steps(offset)
+        else:
+            self.move_steps(offset - self.microsteps_per_step)
 
-        for _ in itertools.repeat(None, num_steps):
-            self.stepper.oneStep(direction, self.Adafruit_MotorHAT.MICROSTEP)
+    def save_state(self):
+        """Persists the position of the base for the next run. Only call on a clean shutdown,
+        once the base is stationary. Returns true if the position was saved.
+        """
+        if not self.position_confident:
+            self.clear_state()
+            return False
+
+        self.align_to_full_step()
+        state = {
+            'position': self.position,
+            'phase': self.get_phase(),
+            'steps_per_rev': self.get_num_steps_per_rev()
+        }
+        # write then rename, so an interrupted write never leaves a partial state file
+        temp_file = self.state_file + '.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump(state, f)
+        os.rename(temp_file, self.state_file)
+        return True
+
+    def load_state(self):
+        """Restores the position persisted by the last clean shutdown.
+        The state file is consumed, so the position is only trusted again if this run
+        also shuts down cleanly. Returns true if the position was restored.
+        """
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+        except (IOError, OSError, ValueError):
+            return False
+        self.clear_state()
+
+        if state.get('steps_per_rev') != self.get_num_steps_per_rev():
+            return False
+        if not isinstance(state.get('position'), int):
+            return False
+
+        self.position = state['position']
+        # the driver restarts from phase 0, so restore the phase matching the rotor position
+        if hasattr(self.stepper, 'currentstep') and isinstance(state.get('phase'), int):
+            self.stepper.currentstep = state['phase']
+        self.position_confident = True
+        return True
+
+    def clear_state(self):
+        """Removes any persisted state"""
+        try:
+            os.remove(self.state_file)
+        except OSError:
+            pass
+
+    def move_steps_async(self, num_steps=None):
+        """Dispatches a move of the specified number of steps to the motion thread,
+        and returns immediately with a MoveFuture for its completion.
+        :param num_steps: # of steps to move, defaults to 1
+        """
+        if num_steps is None:
+            num_steps = 1
+
+        # start the motion thread on first use
+        if self.motion_thread is None:
+            self.motion_thread = threading.Thread(
+                target=self._run_motion_thread, name='motion')
+            self.motion_thread.daemon = True
+            self.motion_thread.start()
+
+        move = MoveFuture(num_steps)
+        self.motion_queue.put(move)
+        return move
+
+    def _run_motion_thread(self):
+        """Executes dispatched moves one after the other"""
+        while True:
+            move = self.motion_queue.get()
+            move.start_time = monotonic()
+            try:
+                self.move_steps(move.num_steps)
+            except Exception as error:  # pylint: disable=broad-except
+                move.error = error
+            move.end_time = monotonic()
+            move.finished.set()
+
+    def start_continuous_rotation(self, steps_per_sec):
+        """Starts rotating the base at a constant rate on a separate thread.
+        Returns the time the rotation started (monotonic clock).
+        :param steps_per_sec: the step rate (positive values rotate in the direction of
+                              move_steps with positive # of steps)
+        """
+        self.rotation_stop.clear()
+        self.rotation_steps_per_sec = float(steps_per_sec)
+        self.rotation_num_steps = 0
+        self.rotation_max_lag = 0.0
+        self.rotation_bus_calls = self.get_bus_calls()
+        self.rotation_start_time = monotonic()
+        self.rotation_log = [(self.rotation_start_time, 0)]
+
+        self.rotation_thread = threading.Thread(
+            target=self._run_continuous_rotation, name='rotation')
+        self.rotation_thread.daemon = True
+        self.rotation_thread.start()
+        return self.rotation_start_time
+
+    def stop_continuous_rotation(self):
+        """Stops the continuous rotation, and returns the number of steps taken"""
+        if self.rotation_thread is not None:
+            self.rotation_stop.set()
+            self.rotation_thread.join()
+            self.rotation_thread = None
+            self.record_motion('continuous_rotation', self.rotation_num_steps,
+                               monotonic() - self.rotation_start_time,
+                               self.get_bus_calls() - self.rotation_bus_calls)
+        return self.rotation_num_steps
+
+    def get_rotation_steps(self, t):
+        """Returns the (fractional) number of steps the continuous rotation had actually
+        taken at the specified time, interpolated between the times of the recorded steps
+        :param t: the time (monotonic clock)
+        """
+        # the log is only ever appended to, so the entries read below are consistent
+        log = self.rotation_log
+        index = bisect.bisect_left(log, (t,))
+        if index == 0:
+            return 0.0
+        if index == len(log):
+            return float(log[-1][1])
+        (t_0, steps_0), (t_1, steps_1) = log[index - 1], log[index]
+        if t_1 <= t_0:
+            return float(steps_1)
+        return steps_0 + (steps_1 - steps_0) * (t - t_0) / (t_1 - t_0)
+
+    def _run_continuous_rotation(self):
+        """Steps the base on a fixed schedule until stopped"""
+        direction = 1 if self.rotation_steps_per_sec > 0 else -1
+        step_period = 1.0 / abs(self.rotation_steps_per_sec)
+        while not self.rotation_stop.is_set():
+            # schedule each step from the start time, so that timing errors do not accumulate
+            delay = self.rotation_start_time + \
+                self.rotation_num_steps * step_period - monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # running late, note how far the base fell behind its schedule
+                self.rotation_max_lag = max(self.rotation_max_lag, -delay / step_period)
+            self.move_step_train(direction)
+            self.rotation_num_steps = self.rotation_num_steps + 1
+            self.rotation_log.append((monotonic(), self.rotation_num_steps))
 
     def move_degrees(self, num_deg=None):
         """Moves the stepper motor by the specified num_deg, as close as step resolution permits.
@@ -71,51 +744,104 @@ class ScannerBase(object):
 
     def get_num_steps_per_rev(self):
         """Returns the number of micro-steps in a full rotation"""
-        return 400 * 8  # 400 steps/rev * 8 microsteps/step
+        return self.stepper_steps_per_rev * self.microsteps_per_step
 
     def get_steps_per_deg(self):
         """Returns the number of steps per degree"""
         return 1.0 * self.get_num_steps_per_rev() / 360.0
 
+    @instrumented('reset')
     def reset(self):
-        """Resets the base angle."""
-        # check that the switch is not already pressed
-        # (edge case where a rising edge event won't occur)
-        if not self.switch.is_pressed():
-            # Move back to home angle, until hitting limit switch.
-            self.switch.setup_event_detect()
-            while not self.switch.check_for_press():
-                # use DOUBLE mode for more torque
-                self.stepper.step(2, self.Adafruit_MotorHAT.FORWARD,
-                                  self.Adafruit_MotorHAT.DOUBLE)
-            self.switch.destroy()
-
-        # Move forward off the switch
-        for _ in itertools.repeat(None, 12):
-            self.stepper.step(1, self.Adafruit_MotorHAT.BACKWARD,
-                              self.Adafruit_MotorHAT.DOUBLE)
-
-        # check that the switch is not already pressed
-        # (edge case where a rising edge event won't occur)
-        if not self.switch.is_pressed():
-            # Move back to home angle, until just hitting limit switch
-            self.switch.setup_event_detect()
-            while not self.switch.check_for_press():
-                # use DOUBLE mode for more torque
-                self.stepper.step(1, self.Adafruit_MotorHAT.FORWARD,
-                                  self.Adafruit_MotorHAT.DOUBLE)
-            self.switch.destroy()
-
+        """Resets the base angle (homes the base against the limit switch).
+        The switch stops the base from its press callback, so it is approached at speed first,
+        then slowly to stop within one step of its edge.
+        """
+        # Move back to home angle at speed, until hitting limit switch
+        self.seek_limit_switch(self.max_step_rate, style=self.transit_style)
+
+        # Move forward off the switch (12 full steps)
+        self.move_planned(12 * self.microsteps_per_step, style=self.transit_style)
+
+        # Move back to home angle slowly, until just hitting limit switch
+        self.seek_limit_switch(self.start_step_rate, style=self.Adafruit_MotorHAT.MICROSTEP)
+
+        # the base is now at the home position
+        self.position = 0
+        self.position_confident = True
+
+    def seek_limit_switch(self, step_rate, max_steps=None, style=None):
+        """Moves the base back towards the home angle until the limit switch is pressed,
+        stopping within one step (of the style) of its edge.
+        Raises a ValueError if the switch is not pressed within the max # of steps.
+        :param step_rate: the max rate of the approach (micro-steps/sec)
+        :param max_steps: the max # of micro-steps to move, defaults to a full revolution
+        :param style: the step style, defaults to MICROSTEP
+        """
+        if style is None:
+            style = self.Adafruit_MotorHAT.MICROSTEP
+        if max_steps is None:
+            max_steps = self.get_num_steps_per_rev()
+
+        pressed = threading.Event()
+        self.switch.subscribe_to_press(lambda channel: pressed.set())
+        try:
+            # check that the switch is not already pressed
+            # (edge case where a falling edge event won't occur)
+            if self.switch.is_pressed():
+                return
+            self.move_planned(-max_steps, style=style, max_rate=step_rate, stop_event=pressed)
+        finally:
+            self.switch.unsubscribe()
+
+        if not pressed.is_set():
+            self.lose_position()
+            raise ValueError("Limit switch was never pressed... aborting homing")
+
+    @instrumented('turn_off_motors')
     def turn_off_motors(self):
         """Turns off stepper motor, recommended for auto-disabling motors on shutdown!"""
+        self.channel_state.clear()
         self.motor_hat.getMotor(1).run(self.Adafruit_MotorHAT.RELEASE)
         self.motor_hat.getMotor(2).run(self.Adafruit_MotorHAT.RELEASE)
         self.motor_hat.getMotor(3).run(self.Adafruit_MotorHAT.RELEASE)
         self.motor_hat.getMotor(4).run(self.Adafruit_MotorHAT.RELEASE)
 
 
+def get_trapezoidal_step_times(num_steps, start_rate, max_rate, acceleration):
+    """Returns the time of each step (relative to the first) of a move which accelerates
+    from the start rate, cruises at the max rate, then decelerates back to the start rate.
+    Short moves never reach the max rate, and decelerate as soon as they are half done.
+    :param num_steps: # of steps to move
+    :param start_rate: the rate at the start and end of the move (steps/sec)
+    :param max_rate: the max rate (steps/sec)
+    :param acceleration: the acceleration (steps/sec^2)
+    """
+    max_rate = max(max_rate, start_rate)
+    # the first step is taken at the start, and the last one at the end of the move
+    distance = np.arange(num_steps, dtype=float)
+    length = max(num_steps - 1, 0)
+
+    # distance covered while accelerating (or until the middle of the move)
+    accel_distance = min((max_rate ** 2 - start_rate ** 2) / (2.0 * acceleration),
+                         0.5 * length)
+    peak_rate = np.sqrt(start_rate ** 2 + 2.0 * acceleration * accel_distance)
+    accel_time = (peak_rate - start_rate) / acceleration
+    total_time = 2.0 * accel_time + (length - 2.0 * accel_distance) / peak_rate
+
+    def get_accel_time(d):
+        """Returns the time to cover a distance from the start rate, while accelerating"""
+        return (np.sqrt(start_rate ** 2 + 2.0 * acceleration * d) - start_rate) / acceleration
+
+    return np.where(
+        distance <= accel_distance, get_accel_time(distance),
+        np.where(distance <= length - accel_distance,
+                 accel_time + (distance - accel_distance) / peak_rate,
+                 total_time - get_accel_time(np.maximum(length - distance, 0))))
+
+
 def test_demo(use_dummy=False):
-    """Performs a small test demo (reset, and move base 90 degrees)"""
+    """Performs a small test demo (reset or restore the persisted position,
+    and move base 90 degrees)"""
     output_json_message(
         {'type': "update", 'status': "setup", 'msg': "Creating base!"})
 
@@ -124,10 +850,14 @@ def test_demo(use_dummy=False):
     # pause to avoid accidentally flushing the previous message contents
     time.sleep(0.1)
 
-    output_json_message(
-        {'type': "update", 'status': "progress", 'msg': "Resetting base..."})
-
-    base.reset()
+    if base.load_state():
+        output_json_message(
+            {'type': "update", 'status': "progress", 'msg': "Returning base to home..."})
+        base.move_to_angle(0)
+    else:
+        output_json_message(
+            {'type': "update", 'status': "progress", 'msg': "Resetting base..."})
+        base.reset()
 
     output_json_message(
         {'type': "update", 'status': "progress", 'msg': "Moving base 90 degrees..."})
@@ -136,8 +866,11 @@ def test_demo(use_dummy=False):
         base.move_degrees(1)
         time.sleep(.1)  # sleep for 100 ms
 
+    base.save_state()
+
     output_json_message(
-        {'type': "update", 'status': "complete", 'msg': "Finished test!"})
+        {'type': "update", 'status': "complete", 'msg': "Finished test!",
+         'stats': base.get_motion_stats()})
 
 
 def main(arg_dict):
@@ -1,12 +1,17 @@
 """ scanner_output: methods for outputting formatted json """
 import sys
 import json
+import threading
+
+# Serializes the messages of concurrent threads, so their lines are not interleaved
+output_lock = threading.Lock()
 
 
 def output_message(message):
     """Print the provided input & flush stdout so parent process registers the message"""
-    print message
-    sys.stdout.flush()
+    with output_lock:
+        print message
+        sys.stdout.flush()
 
 
 def output_json_message(json_input):
@@ -0,0 +1,75 @@
+"""Tests for scan_utils (run with: python -m unittest discover)"""
+import unittest
+import numpy as np
+import scan_utils
+
+
+class SelectOrderedRunsTest(unittest.TestCase):
+    """Tests the salvaging of the ordered runs of unordered scans"""
+
+    def test_ordered_scan_is_kept(self):
+        angle = np.arange(0, 360000, 1000)
+        self.assertTrue(np.all(scan_utils.select_ordered_runs(angle)))
+
+    def test_samples_outside_rotation_are_dropped(self):
+        angle = np.array([-1000, 1000, 2000, 360000])
+        keep = scan_utils.select_ordered_runs(angle)
+        self.assertEqual(keep.tolist(), [False, True, True, False])
+
+    def test_isolated_sample_in_corrupted_stretch_is_dropped(self):
+        # the corrupted stretch holds a single sample (4000) which would fit in order between
+        # the good runs, but it is not part of an ordered run so it must not be spliced in
+        good_1 = [1000, 2000, 3000]
+        corrupted = [2500, 300000, 4000, 100, 350000]
+        good_2 = [5000, 6000, 7000]
+        angle = np.array(good_1 + corrupted + good_2)
+        keep = scan_utils.select_ordered_runs(angle)
+        self.assertEqual(angle[keep].tolist(), good_1 + good_2)
+
+    def test_chain_keeps_most_samples(self):
+        # runs: [10, 20, 30], [5, 6, 7, 8], [40, 50, 60]
+        angle = np.array([10, 20, 30, 5, 6, 7, 8, 40, 50, 60]) * 1000
+        keep = scan_utils.select_ordered_runs(angle)
+        self.assertEqual((angle[keep] / 1000).tolist(), [5, 6, 7, 8, 40, 50, 60])
+
+    def test_min_run_length(self):
+        # runs: [1, 2, 3], [2.5, 300], [4], [0.1, 350], [5, 6, 7]
+        angle = np.array([1000, 2000, 3000, 2500, 300000, 4000, 100, 350000, 5000, 6000, 7000])
+        keep = scan_utils.select_ordered_runs(angle, min_run_length=1)
+        self.assertEqual(angle[keep].tolist(), [1000, 2000, 3000, 4000, 5000, 6000, 7000])
+
+    def test_matches_exhaustive_search(self):
+        rng = np.random.RandomState(0)
+        for _ in range(200):
+            angle = rng.randint(-2, 20, rng.randint(1, 16)) * 20000
+            for min_run_length in [1, 3]:
+                keep = scan_utils.select_ordered_runs(angle, min_run_length)
+                self.assertEqual(np.count_nonzero(keep), _best_chain_size(angle, min_run_length))
+            kept = angle[keep]
+            self.assertTrue(np.all(np.diff(kept) > 0))
+
+
+def _best_chain_size(angle, min_run_length):
+    """Returns the # of samples of the best chain of whole runs, by trying every subset"""
+    valid = angle[(angle >= 0) & (angle < 360000)]
+    if np.all(np.diff(valid) > 0):
+        # ordered scans are kept whole
+        return len(valid)
+    runs = []
+    for index, value in enumerate(angle.tolist()):
+        if not 0 <= value < 360000:
+            continue
+        if runs and runs[-1][-1][0] == index - 1 and runs[-1][-1][1] < value:
+            runs[-1].append((index, value))
+        else:
+            runs.append([(index, value)])
+    runs = [run for run in runs if len(run) >= min_run_length]
+    best = 0
+    for mask in range(1 << len(runs)):
+        chosen = [run for bit, run in enumerate(runs) if mask >> bit & 1]
+        if all(prior[-1][1] < run[0][1] for prior, run in zip(chosen, chosen[1:])):
+            best = max(best, sum(len(run) for run in chosen))
+    return best
+
+if __name__ == '__main__':
+    unittest.main()
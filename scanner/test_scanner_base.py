@@ -0,0 +1,66 @@
+"""Tests for scanner_base, with the dummy motor hat (run with: python -m unittest discover)"""
+import unittest
+import dummy_Adafruit_MotorHAT
+import scanner_base
+
+
+class _PWMState(object):
+    """Stands in for the PWM driver of the dummy motor hat, keeping the last values written
+    to each channel (ie: the state of the hardware)"""
+
+    def __init__(self):
+        self.channels = {}
+
+    def setPWM(self, channel, on, off):
+        self.channels[channel] = (on, off)
+
+
+class StepTrainTest(unittest.TestCase):
+    """Tests that step trains leave the coils in the state of the phase they reach"""
+
+    def setUp(self):
+        self.bus_latency = dummy_Adafruit_MotorHAT.Adafruit_MotorHAT.bus_latency
+        dummy_Adafruit_MotorHAT.Adafruit_MotorHAT.bus_latency = 0
+        self.base = scanner_base.ScannerBase(use_dummy=True)
+        self.pwm = _PWMState()
+        self.base.bus.pwm = self.pwm
+        self.microstep = self.base.Adafruit_MotorHAT.MICROSTEP
+
+    def tearDown(self):
+        dummy_Adafruit_MotorHAT.Adafruit_MotorHAT.bus_latency = self.bus_latency
+
+    def move_one_step_per_call(self, num_steps):
+        """Moves with the library's oneStep, as done for styles without a phase table"""
+        phase_tables, self.base.phase_tables = self.base.phase_tables, {}
+        try:
+            self.base.move_steps(num_steps)
+        finally:
+            self.base.phase_tables = phase_tables
+
+    def assert_coils_match_phase(self):
+        phase = self.base.stepper.currentstep
+        for channel, on, off in self.base.phase_tables[self.microstep][phase]:
+            self.assertEqual(self.pwm.channels.get(channel), (on, off))
+
+    def test_phase_tables_are_not_counted(self):
+        # the phase tables are recorded without any call reaching the motor hat
+        self.assertEqual(self.base.get_bus_calls(), 0)
+        self.assertNotIn('oneStep', self.base.motor_hat.get_call_counts())
+
+    def test_step_train(self):
+        self.base.move_steps(13)
+        self.assert_coils_match_phase()
+        self.base.move_steps(-40)
+        self.assert_coils_match_phase()
+
+    def test_fallback_move_then_step_train(self):
+        # the step train caches the values of its last phase, the fallback then moves the
+        # coils a step further, and the next step train returns to the cached phase
+        self.base.move_steps(-8)
+        self.move_one_step_per_call(-1)
+        self.base.move_steps(1)
+        self.assert_coils_match_phase()
+        self.assertEqual(self.base.get_position(), -8)
+
+if __name__ == '__main__':
+    unittest.main()
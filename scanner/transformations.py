@@ -343,6 +343,58 @@ def rotation_matrix(angle, direction, point=None):
     return M
 
 
+def rotation_matrices(angles, direction, point=None):
+    """Return stacked matrices to rotate about axes defined by point and direction.
+
+    Batched version of rotation_matrix. The angles and the (N, 3) or (3,)
+    direction are broadcast against each other.
+
+    >>> angles = (numpy.random.random(10) - 0.5) * (2*math.pi)
+    >>> direc = numpy.random.random(3) - 0.5
+    >>> point = numpy.random.random(3) - 0.5
+    >>> R = rotation_matrices(angles, direc, point)
+    >>> R.shape
+    (10, 4, 4)
+    >>> all(numpy.allclose(R[i], rotation_matrix(angles[i], direc, point))
+    ...     for i in range(10))
+    True
+    >>> direc = numpy.random.random((10, 3)) - 0.5
+    >>> R = rotation_matrices(angles, direc)
+    >>> all(numpy.allclose(R[i], rotation_matrix(angles[i], direc[i]))
+    ...     for i in range(10))
+    True
+
+    """
+    angles = numpy.atleast_1d(numpy.array(angles, dtype=numpy.float64))
+    direction = numpy.array(direction, dtype=numpy.float64)[..., :3]
+    angles, _ = numpy.broadcast_arrays(angles, direction[..., 0])
+    angles = angles.ravel()
+    size = len(angles)
+    direction = unit_vector(
+        numpy.broadcast_to(direction, (size, 3)).copy(), axis=1)
+    sina = numpy.sin(angles)
+    cosa = numpy.cos(angles)
+    # rotation matrices around unit vectors
+    R = cosa[:, None, None] * numpy.identity(3)
+    R += numpy.einsum('ni,nj->nij', direction, direction) * \
+        (1.0 - cosa)[:, None, None]
+    direction *= sina[:, None]
+    R[:, 0, 1] -= direction[:, 2]
+    R[:, 0, 2] += direction[:, 1]
+    R[:, 1, 0] += direction[:, 2]
+    R[:, 1, 2] -= direction[:, 0]
+    R[:, 2, 0] -= direction[:, 1]
+    R[:, 2, 1] += direction[:, 0]
+    M = numpy.zeros((size, 4, 4))
+    M[:, :3, :3] = R
+    M[:, 3, 3] = 1.0
+    if point is not None:
+        # rotation not around origin
+        point = numpy.array(point[:3], dtype=numpy.float64)
+        M[:, :3, 3] = point - numpy.einsum('nij,j->ni', R, point)
+    return M
+
+
 def rotation_from_matrix(matrix):
     """Return rotation angle and axis from rotation matrix.
 
@@ -1109,6 +1161,70 @@ def euler_matrix(ai, aj, ak, axes='sxyz'):
     return M
 
 
+def euler_matrices(ai, aj, ak, axes='sxyz'):
+    """Return stacked homogeneous rotation matrices from arrays of Euler angles.
+
+    Batched version of euler_matrix. The angles ai, aj and ak are broadcast
+    against each other, and an array of shape (N, 4, 4) is returned.
+
+    >>> ai, aj, ak = (4*math.pi) * (numpy.random.random((3, 10)) - 0.5)
+    >>> for axes in _AXES2TUPLE.keys():
+    ...    M = euler_matrices(ai, aj, ak, axes)
+    ...    assert all(numpy.allclose(M[n], euler_matrix(ai[n], aj[n], ak[n],
+    ...                                                 axes)) for n in range(10))
+    >>> euler_matrices(0.0, [0.0, 1.0, 2.0], 0.0, (0, 1, 0, 1)).shape
+    (3, 4, 4)
+
+    """
+    try:
+        firstaxis, parity, repetition, frame = _AXES2TUPLE[axes]
+    except (AttributeError, KeyError):
+        _TUPLE2AXES[axes]  # validation
+        firstaxis, parity, repetition, frame = axes
+
+    i = firstaxis
+    j = _NEXT_AXIS[i+parity]
+    k = _NEXT_AXIS[i-parity+1]
+
+    ai, aj, ak = [a.ravel() for a in numpy.broadcast_arrays(
+        *[numpy.atleast_1d(numpy.array(a, dtype=numpy.float64))
+          for a in (ai, aj, ak)])]
+
+    if frame:
+        ai, ak = ak, ai
+    if parity:
+        ai, aj, ak = -ai, -aj, -ak
+
+    si, sj, sk = numpy.sin(ai), numpy.sin(aj), numpy.sin(ak)
+    ci, cj, ck = numpy.cos(ai), numpy.cos(aj), numpy.cos(ak)
+    cc, cs = ci*ck, ci*sk
+    sc, ss = si*ck, si*sk
+
+    M = numpy.zeros((len(ai), 4, 4))
+    M[:, 3, 3] = 1.0
+    if repetition:
+        M[:, i, i] = cj
+        M[:, i, j] = sj*si
+        M[:, i, k] = sj*ci
+        M[:, j, i] = sj*sk
+        M[:, j, j] = -cj*ss+cc
+        M[:, j, k] = -cj*cs-sc
+        M[:, k, i] = -sj*ck
+        M[:, k, j] = cj*sc+cs
+        M[:, k, k] = cj*cc-ss
+    else:
+        M[:, i, i] = cj*ck
+        M[:, i, j] = sj*sc-cs
+        M[:, i, k] = sj*cc+ss
+        M[:, j, i] = cj*sk
+        M[:, j, j] = sj*ss+cc
+        M[:, j, k] = sj*cs-sc
+        M[:, k, i] = -sj
+        M[:, k, j] = cj*si
+        M[:, k, k] = cj*ci
+    return M
+
+
 def euler_from_matrix(matrix, axes='sxyz'):
     """Return Euler angles from rotation matrix for specified axis sequence.
 
@@ -1278,6 +1394,41 @@ def quaternion_matrix(quaternion):
         [                0.0,                 0.0,                 0.0, 1.0]])
 
 
+def quaternion_matrices(quaternions):
+    """Return stacked homogeneous rotation matrices from an array of quaternions.
+
+    Batched version of quaternion_matrix. Return array of shape (N, 4, 4)
+    for quaternions of shape (N, 4).
+
+    >>> q = numpy.array([random_quaternion() for _ in range(10)])
+    >>> q[3] = 0.0
+    >>> M = quaternion_matrices(q)
+    >>> all(numpy.allclose(M[i], quaternion_matrix(q[i])) for i in range(10))
+    True
+    >>> numpy.allclose(M[3], numpy.identity(4))
+    True
+
+    """
+    q = numpy.array(quaternions, dtype=numpy.float64).reshape(-1, 4)
+    n = numpy.einsum('ij,ij->i', q, q)
+    degenerate = n < _EPS
+    q *= numpy.sqrt(2.0 / numpy.where(degenerate, 1.0, n))[:, None]
+    q = numpy.einsum('ni,nj->nij', q, q)
+    M = numpy.zeros((len(n), 4, 4))
+    M[:, 0, 0] = 1.0-q[:, 2, 2]-q[:, 3, 3]
+    M[:, 0, 1] = q[:, 1, 2]-q[:, 3, 0]
+    M[:, 0, 2] = q[:, 1, 3]+q[:, 2, 0]
+    M[:, 1, 0] = q[:, 1, 2]+q[:, 3, 0]
+    M[:, 1, 1] = 1.0-q[:, 1, 1]-q[:, 3, 3]
+    M[:, 1, 2] = q[:, 2, 3]-q[:, 1, 0]
+    M[:, 2, 0] = q[:, 1, 3]-q[:, 2, 0]
+    M[:, 2, 1] = q[:, 2, 3]+q[:, 1, 0]
+    M[:, 2, 2] = 1.0-q[:, 1, 1]-q[:, 2, 2]
+    M[:, 3, 3] = 1.0
+    M[degenerate] = numpy.identity(4)
+    return M
+
+
 def quaternion_from_matrix(matrix, isprecise=False):
     """Return quaternion from rotation matrix.
 
@@ -1469,6 +1620,57 @@ def quaternion_slerp(quat0, quat1, fraction, spin=0, shortestpath=True):
     return q0
 
 
+def quaternion_slerps(quat0, quat1, fractions, spin=0, shortestpath=True):
+    """Return spherical linear interpolations between quaternions.
+
+    Batched version of quaternion_slerp. The (N, 4) or (4,) quaternions and
+    the fractions are broadcast against each other, and an array of shape
+    (N, 4) is returned.
+
+    >>> q0 = random_quaternion()
+    >>> q1 = random_quaternion()
+    >>> fractions = numpy.linspace(0, 1, 11)
+    >>> q = quaternion_slerps(q0, q1, fractions)
+    >>> q.shape
+    (11, 4)
+    >>> all(numpy.allclose(q[i], quaternion_slerp(q0, q1, fractions[i]))
+    ...     for i in range(11))
+    True
+    >>> q0 = numpy.array([random_quaternion() for _ in range(5)])
+    >>> q = quaternion_slerps(q0, -q0, 0.5)
+    >>> numpy.allclose(q, q0)
+    True
+
+    """
+    fractions = numpy.atleast_1d(numpy.array(fractions, dtype=numpy.float64))
+    q0 = numpy.array(quat0, dtype=numpy.float64)[..., :4]
+    q1 = numpy.array(quat1, dtype=numpy.float64)[..., :4]
+    fractions, _, _ = numpy.broadcast_arrays(
+        fractions, q0[..., 0], q1[..., 0])
+    fractions = fractions.ravel()
+    size = len(fractions)
+    q0 = unit_vector(numpy.broadcast_to(q0, (size, 4)).copy(), axis=1)
+    q1 = unit_vector(numpy.broadcast_to(q1, (size, 4)).copy(), axis=1)
+    q1_original = q1.copy()
+    d = numpy.einsum('ij,ij->i', q0, q1)
+    # quaternions which are (anti)parallel are not interpolated
+    parallel = numpy.abs(numpy.abs(d) - 1.0) < _EPS
+    if shortestpath:
+        # invert rotation
+        invert = d < 0.0
+        d[invert] = -d[invert]
+        q1[invert] = -q1[invert]
+    angle = numpy.arccos(numpy.clip(d, -1.0, 1.0)) + spin * math.pi
+    degenerate = parallel | (numpy.abs(angle) < _EPS)
+    isin = 1.0 / numpy.sin(numpy.where(degenerate, 1.0, angle))
+    q = q0 * (numpy.sin((1.0 - fractions) * angle) * isin)[:, None]
+    q += q1 * (numpy.sin(fractions * angle) * isin)[:, None]
+    q[degenerate] = q0[degenerate]
+    q[fractions == 0.0] = q0[fractions == 0.0]
+    q[fractions == 1.0] = q1_original[fractions == 1.0]
+    return q
+
+
 def random_quaternion(rand=None):
     """Return uniform random unit quaternion.
 